@@ -0,0 +1,222 @@
+"""Benchmarks the bots' hot paths against a local mock BSC node.
+
+    python3 -m benchmarks.bench [--iterations 20] [--latency 0.02] [--error-rate 0.05]
+
+For each operation this reports node requests, contract calls, wall time and
+peak memory allocated per run, so regressions show up before deployment."""
+import argparse
+import asyncio
+import math
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from web3 import Web3
+
+from benchmarks.mocknode import MockNode
+from bot.utils import abi_cache, intern_abi
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ADDRESSES = {name: Web3.toChecksumAddress(f"0x{i + 0x1000:040x}") for i, name in enumerate((
+    'token', 'lp', 'cash', 'cash_lp', 'share', 'share_lp', 'bond', 'rewards', 'treasury',
+    'boardroom', 'game_fund', 'community_fund', 'dev_fund'))}
+BNB = '0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c'
+BUSD = '0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56'
+BNB_BUSD_LP = '0x58F876857a02D6762E0101bb5C46A8c1ED44Dc16'
+
+
+def function(name, inputs=(), outputs=('uint256',)):
+    return {'type': 'function', 'name': name, 'stateMutability': 'view',
+            'inputs': [{'name': f'arg{i}', 'type': kind} for i, kind in enumerate(inputs)],
+            'outputs': [{'name': '', 'type': kind} for kind in outputs]}
+
+
+ERC20 = [function('balanceOf', ['address']), function('totalSupply'),
+         function('decimals', outputs=['uint8'])]
+ABIS = {
+    BNB: ERC20,
+    'token': ERC20,
+    'lp': ERC20,
+    'cash': ERC20,
+    'cash_lp': ERC20,
+    'share': ERC20 + [function('unclaimedTreasuryFund'), function('unclaimedDevFund')],
+    'share_lp': ERC20,
+    'bond': ERC20,
+    'rewards': [function('startBlock'), function('TOTAL_REWARDS'),
+                function('getGeneratedReward', ['uint256', 'uint256']),
+                function('balanceOf', ['uint256', 'address']),
+                function('pendingRewards', ['uint256', 'address'])],
+    'treasury': [function(name) for name in (
+        'epoch', 'nextEpochPoint', 'getDollarPrice', 'seigniorageSaved', 'maxSupplyExpansionPercent',
+        'getBurnableDollarLeft', 'gameFundSharedPercent', 'PERIOD')] + [{
+            'type': 'event', 'name': 'BoilerFunded', 'anonymous': False,
+            'inputs': [{'name': 'timestamp', 'type': 'uint256', 'indexed': False},
+                       {'name': 'seigniorage', 'type': 'uint256', 'indexed': False}]}],
+    'boardroom': [function('totalSupply')]
+}
+
+
+def make_bots(node, workdir):
+    from boardroombot.boardroombot import BoardroomBot
+    from pricebot.commands.price import Prices
+    from pricebot.pricebot import PriceBot
+
+    # the bundle path of fetch_abi, without touching contracts/
+    for name, abi in ABIS.items():
+        abi_cache[ADDRESSES.get(name, name)] = intern_abi(abi)
+
+    node.pairs[ADDRESSES['lp']] = (BNB, ADDRESSES['token'])
+    node.pairs[BNB_BUSD_LP] = (BNB, BUSD)
+
+    config = {
+        'bsc_node': node.url,
+        'refresh_rate': 60,
+        'bnb_emoji': 'BNB',
+        'snapshot_max_age': 0,
+        'constants_file': os.path.join(workdir, 'constants.json'),
+        'database': f"sqlite:///{os.path.join(workdir, 'pricebot.db')}",
+        'amm': {'bench': {'name': 'Bench', 'address': BNB_BUSD_LP}}
+    }
+    common = {'name': 'BENCH', 'amm': 'bench', 'apikey': ''}
+
+    pricebot = PriceBot(config, common, {
+        'contract': ADDRESSES['token'], 'lp': ADDRESSES['lp'], 'decimals': 18,
+        'icon': 'BENCH', 'emoji': None})
+    boardroombot = BoardroomBot(config, common, {
+        **{name: ADDRESSES[name] for name in ABIS if name in ADDRESSES and name not in ('token', 'lp')},
+        'game_fund': ADDRESSES['game_fund'],
+        'community_fund': ADDRESSES['community_fund'],
+        'dev_fund': ADDRESSES['dev_fund'],
+        'stats_channels': []})
+
+    # there is no Discord connection to publish nicknames and presences to
+    pricebot.publisher.schedule = lambda *args: None
+    boardroombot.publisher.schedule = lambda *args: None
+
+    return (pricebot, Prices(pricebot), boardroombot)
+
+
+def measure(loop, node, operation, iterations):
+    def run():
+        result = operation()
+        if asyncio.iscoroutine(result):
+            loop.run_until_complete(result)
+
+    timings, errors = [], 0
+    node.reset()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        try:
+            run()
+        except Exception:
+            errors += 1
+        timings.append(time.perf_counter() - start)
+    counts = dict(node.counts)
+
+    # allocations are measured separately, tracemalloc skews the timings
+    peaks = []
+    tracemalloc.start()
+    for _ in range(min(iterations, 5)):
+        tracemalloc.reset_peak()
+        (before, _) = tracemalloc.get_traced_memory()
+        try:
+            run()
+        except Exception:
+            pass
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return {
+        'requests': counts.get('requests', 0) / iterations,
+        'calls': counts.get('calls', 0) / iterations,
+        'mean': statistics.mean(timings),
+        'p95': sorted(timings)[math.ceil(len(timings) * 0.95) - 1],
+        'peak_kib': statistics.mean(peaks) / 1024,
+        'errors': errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds added to every node request')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='fraction of node requests that fail')
+    parser.add_argument('--catch-up', type=int, default=1200,
+                        help='blocks missed before each get_latest_events run')
+    parser.add_argument('--output', help='also write the report to this file')
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    node = MockNode(latency=args.latency,
+                    error_rate=args.error_rate).start()
+    loop = asyncio.get_event_loop()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        (pricebot, prices, boardroombot) = make_bots(node, workdir)
+        loop.run_until_complete(boardroombot.run_rpc(boardroombot.get_epoch))
+
+        def get_latest_events():
+            node.mine(args.catch_up)
+            return boardroombot.get_latest_events()
+
+        def next_block(operation):
+            # price updates run once per block
+            def run():
+                node.mine()
+                return operation()
+            return run
+
+        def get_token_price_cached():
+            pricebot.chain.snapshots.max_age = 60
+            try:
+                return pricebot.get_token_price()
+            finally:
+                pricebot.chain.snapshots.max_age = 0
+
+        def get_token_price_balances():
+            (reserves, pricebot.chain.reserves) = (pricebot.chain.reserves, None)
+            try:
+                return pricebot.get_token_price()
+            finally:
+                pricebot.chain.reserves = reserves
+
+        operations = [
+            ('PriceBot.get_token_price', next_block(pricebot.get_token_price)),
+            ('PriceBot.get_token_price (balances)', next_block(get_token_price_balances)),
+            ('PriceBot.get_token_price (cached)', get_token_price_cached),
+            ('Prices.update_price', next_block(prices.update_price)),
+            ('BoardroomBot.get_epoch', boardroombot.get_epoch),
+            ('BoardroomBot.generate_stats', boardroombot.generate_stats),
+            ('BoardroomBot.get_latest_events', get_latest_events)
+        ]
+
+        lines = [f"{'operation':<36} {'requests':>9} {'calls':>7} {'mean ms':>9} "
+                 f"{'p95 ms':>9} {'peak KiB':>9} {'errors':>7}"]
+        for name, operation in operations:
+            result = measure(loop, node, operation, args.iterations)
+            lines.append(
+                f"{name:<36} {result['requests']:>9.1f} {result['calls']:>7.1f} "
+                f"{result['mean'] * 1000:>9.2f} {result['p95'] * 1000:>9.2f} "
+                f"{result['peak_kib']:>9.1f} {result['errors']:>7}")
+
+        pricebot.price_history.flush()
+        pricebot.database.release()
+        boardroombot.database.release()
+        pricebot.chain.release()
+
+    node.stop()
+
+    report = '\n'.join(lines)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
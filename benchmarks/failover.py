@@ -0,0 +1,83 @@
+"""Checks the node pool against mock nodes that go down, fail or slow down.
+
+    python3 -m benchmarks.failover [--requests 50] [--hedge-after 0.1]
+
+Every scenario must answer every request; the report shows how latency held
+up and which node served the requests."""
+import argparse
+import math
+import statistics
+import time
+
+from benchmarks.mocknode import MockNode
+from bot.chain import Chain
+
+
+def scenario(name, nodes, requests, hedge_after=None, during=None):
+    """Runs requests through a pool of the nodes, calling during(i, node) with
+    the node the pool prefers once it has measured them all."""
+    chain = Chain({'bsc_node': [node.url for node in nodes], 'rpc_timeout': 2,
+                   'rpc_hedge_after': hedge_after, 'constants_file': 'bench_constants.json'})
+    for _ in nodes:
+        chain.web3.eth.block_number
+
+    preferred = next(node for node in nodes
+                     if node.url == chain.web3.provider.ranked()[0].node)
+    for node in nodes:
+        node.reset()
+
+    timings, errors = [], 0
+    for i in range(requests):
+        if during:
+            during(i, preferred)
+        start = time.perf_counter()
+        try:
+            chain.web3.eth.block_number
+        except Exception:
+            errors += 1
+        timings.append(time.perf_counter() - start)
+
+    served = ' / '.join(str(node.counts['requests']) for node in sorted(
+        nodes, key=lambda node: node is not preferred))
+    chain.release()
+    for node in nodes:
+        (node.error_rate, node.latency) = (0, 0)
+
+    return (f"{name:<28} {errors:>7} {statistics.mean(timings) * 1000:>9.2f} "
+            f"{sorted(timings)[math.ceil(len(timings) * 0.95) - 1] * 1000:>9.2f}   {served}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--hedge-after', type=float, default=0.1)
+    args = parser.parse_args()
+    half = args.requests // 2
+
+    def erroring(i, node):
+        node.error_rate = 1 if i >= half else 0
+
+    def slowing(i, node):
+        node.latency = 1 if i >= half else 0
+
+    def stopping(i, node):
+        if i == half:
+            node.stop()
+
+    nodes = [MockNode().start(), MockNode().start()]
+    lines = [f"{'scenario':<28} {'errors':>7} {'mean ms':>9} {'p95 ms':>9}   requests (preferred / other)",
+             scenario('healthy', nodes, args.requests),
+             scenario('preferred starts failing', nodes, args.requests, during=erroring),
+             scenario('preferred slows down', nodes, args.requests, during=slowing),
+             scenario('preferred slows, hedged', nodes, args.requests, args.hedge_after, during=slowing),
+             scenario('preferred goes down', nodes, args.requests, during=stopping)]
+
+    for node in nodes:
+        if not node.down:
+            node.stop()
+
+    print('\n'.join(lines))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eth_abi import decode_abi, encode_abi
+from eth_utils import event_signature_to_log_topic, function_signature_to_4byte_selector, to_checksum_address
+
+MULTICALL_SELECTOR = function_signature_to_4byte_selector(
+    'tryBlockAndAggregate(bool,(address,bytes)[])')
+BOILER_FUNDED_TOPIC = event_signature_to_log_topic(
+    'BoilerFunded(uint256,uint256)')
+SYNC_TOPIC = event_signature_to_log_topic('Sync(uint112,uint112)')
+
+# functions whose value the bots do arithmetic on, so they need sane numbers
+CONSTANTS = {
+    function_signature_to_4byte_selector('decimals()'): 18,
+    function_signature_to_4byte_selector('PERIOD()'): 21600,
+    function_signature_to_4byte_selector('gameFundSharedPercent()'): 1000,
+    function_signature_to_4byte_selector('maxSupplyExpansionPercent()'): 450,
+    function_signature_to_4byte_selector('startBlock()'): 1000000,
+    function_signature_to_4byte_selector('getDollarPrice()'): 105 * 10 ** 16
+}
+EPOCH = function_signature_to_4byte_selector('epoch()')
+NEXT_EPOCH_POINT = function_signature_to_4byte_selector('nextEpochPoint()')
+BALANCE_OF = function_signature_to_4byte_selector('balanceOf(address)')
+GET_RESERVES = function_signature_to_4byte_selector('getReserves()')
+PAIR_TOKENS = [function_signature_to_4byte_selector('token0()'),
+               function_signature_to_4byte_selector('token1()')]
+
+
+class MockNode:
+    """A deterministic stand-in for a BSC JSON-RPC node.
+
+    Serves eth_call (plain and through Multicall3), eth_getLogs and block
+    headers from values derived from the block number, so runs are
+    repeatable. Latency and errors can be injected, and every request is
+    counted by method.
+
+    Addresses added to `pairs` (pair -> (token0, token1)) behave like
+    UniswapV2 pairs: getReserves agrees with the tokens' balanceOf, and a
+    Sync is logged for them on every block."""
+
+    def __init__(self, start_block=10000000, block_time=0, epoch_blocks=7200,
+                 latency=0, error_rate=0, seed=0, port=0):
+        self.start_block = start_block
+        self.block_time = block_time
+        self.epoch_blocks = epoch_blocks
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.started = time.monotonic()
+        self.mined = 0
+        self.down = False
+        self.pairs = {}
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                if node.down:
+                    # drop the connection, as a crashed node would
+                    self.close_connection = True
+                    return
+
+                request = json.loads(self.rfile.read(
+                    int(self.headers['Content-Length'])))
+                response = json.dumps(node.handle(request)).encode()
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.down = True
+        self.server.shutdown()
+        self.server.server_close()
+
+    def mine(self, blocks=1):
+        self.mined += blocks
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+    @property
+    def block_number(self):
+        elapsed = time.monotonic() - self.started
+        timed = int(elapsed / self.block_time) if self.block_time else 0
+        return self.start_block + self.mined + timed
+
+    def handle(self, request):
+        if isinstance(request, list):
+            with self.lock:
+                self.counts['batch'] += 1
+            return [self.handle(item) for item in request]
+
+        with self.lock:
+            self.counts['requests'] += 1
+            self.counts[request['method']] += 1
+            fail = self.random.random() < self.error_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if fail:
+            return {'jsonrpc': '2.0', 'id': request['id'],
+                    'error': {'code': -32000, 'message': 'injected failure'}}
+
+        try:
+            result = getattr(self, request['method'])(*request['params'])
+        except AttributeError:
+            return {'jsonrpc': '2.0', 'id': request['id'],
+                    'error': {'code': -32601, 'message': f"{request['method']} not supported"}}
+
+        return {'jsonrpc': '2.0', 'id': request['id'], 'result': result}
+
+    def parse_block(self, block):
+        if block in ('latest', 'pending', None):
+            return self.block_number
+        if block == 'earliest':
+            return 0
+        return int(block, 16)
+
+    def value(self, target, data, block_number):
+        """A deterministic uint256 for a call, drifting slowly per block."""
+        selector = data[:4]
+        if selector in CONSTANTS:
+            return CONSTANTS[selector]
+        if selector == EPOCH:
+            return block_number // self.epoch_blocks
+        if selector == NEXT_EPOCH_POINT:
+            return int(time.time()) + 3600
+
+        digest = hashlib.sha256(target.lower().encode() + data).digest()
+        base = int.from_bytes(digest[:8], 'big') * 10 ** 6 + 10 ** 21
+        return base + base * (block_number % 1000) // 100000
+
+    def reserves(self, pair, block_number):
+        # what each token's balanceOf(pair) returns, so both ways of reading agree
+        call_data = BALANCE_OF + encode_abi(['address'], [pair])
+        return [self.value(token, call_data, block_number) for token in self.pairs[pair]]
+
+    def call(self, target, data, block_number):
+        with self.lock:
+            self.counts['calls'] += 1
+
+        pair = to_checksum_address(target)
+        if pair in self.pairs:
+            if data[:4] == GET_RESERVES:
+                return encode_abi(['uint112', 'uint112', 'uint32'],
+                                  self.reserves(pair, block_number) + [block_number * 3 % 2 ** 32])
+            if data[:4] in PAIR_TOKENS:
+                return encode_abi(['address'], [self.pairs[pair][PAIR_TOKENS.index(data[:4])]])
+
+        return encode_abi(['uint256'], [self.value(target, data, block_number)])
+
+    def block_hash(self, block_number):
+        return '0x' + hashlib.sha256(str(block_number).encode()).hexdigest()
+
+    # JSON-RPC methods
+
+    def eth_chainId(self):
+        return hex(56)
+
+    def net_version(self):
+        return '56'
+
+    def eth_blockNumber(self):
+        return hex(self.block_number)
+
+    def eth_call(self, transaction, block='latest'):
+        block_number = self.parse_block(block)
+        data = bytes.fromhex(transaction['data'][2:])
+
+        if data[:4] != MULTICALL_SELECTOR:
+            return '0x' + self.call(transaction['to'], data, block_number).hex()
+
+        (_, calls) = decode_abi(['bool', '(address,bytes)[]'], data[4:])
+        results = [(True, self.call(target, call_data, block_number))
+                   for target, call_data in calls]
+        return '0x' + encode_abi(
+            ['uint256', 'bytes32', '(bool,bytes)[]'],
+            [block_number, bytes.fromhex(self.block_hash(block_number)[2:]), results]).hex()
+
+    def log(self, address, topic, data, block_number, log_index=0):
+        return {
+            'address': address,
+            'topics': ['0x' + topic.hex()],
+            'data': '0x' + data.hex(),
+            'blockNumber': hex(block_number),
+            'blockHash': self.block_hash(block_number),
+            'transactionHash': self.block_hash(-block_number),
+            'transactionIndex': '0x0',
+            'logIndex': hex(log_index),
+            'removed': False
+        }
+
+    def eth_getLogs(self, log_filter):
+        from_block = self.parse_block(log_filter.get('fromBlock'))
+        to_block = self.parse_block(log_filter.get('toBlock'))
+        addresses = log_filter.get('address')
+        if not isinstance(addresses, list):
+            addresses = [addresses]
+        topic = (log_filter.get('topics') or [None])[0]
+
+        logs = []
+        if topic in (None, '0x' + BOILER_FUNDED_TOPIC.hex()):
+            # seigniorage is allocated on the first block of every epoch
+            first = -(-from_block // self.epoch_blocks) * self.epoch_blocks
+            logs += [self.log(addresses[0], BOILER_FUNDED_TOPIC, encode_abi(
+                ['uint256', 'uint256'], [1600000000 + block_number * 3, 10 ** 21]), block_number)
+                for block_number in range(first, to_block + 1, self.epoch_blocks)]
+
+        if topic in (None, '0x' + SYNC_TOPIC.hex()):
+            pairs = [to_checksum_address(address) for address in addresses
+                     if address and to_checksum_address(address) in self.pairs]
+            logs += [self.log(pair, SYNC_TOPIC, encode_abi(
+                ['uint112', 'uint112'], self.reserves(pair, block_number)), block_number, i)
+                for block_number in range(from_block, to_block + 1)
+                for i, pair in enumerate(pairs)]
+
+        return logs
+
+    def eth_getBlockByNumber(self, block, full_transactions=False):
+        block_number = self.parse_block(block)
+        return {
+            'number': hex(block_number),
+            'hash': self.block_hash(block_number),
+            'parentHash': self.block_hash(block_number - 1),
+            'nonce': '0x0000000000000000',
+            'sha3Uncles': '0x' + '00' * 32,
+            'logsBloom': '0x' + '00' * 256,
+            'transactionsRoot': '0x' + '00' * 32,
+            'stateRoot': '0x' + '00' * 32,
+            'receiptsRoot': '0x' + '00' * 32,
+            'miner': '0x' + '00' * 20,
+            'difficulty': '0x2',
+            'totalDifficulty': hex(block_number * 2),
+            'extraData': '0x' + '00' * 97,
+            'size': '0x200',
+            'gasLimit': hex(30000000),
+            'gasUsed': '0x0',
+            'timestamp': hex(1600000000 + block_number * 3),
+            'transactions': [],
+            'uncles': []
+        }
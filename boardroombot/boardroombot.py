@@ -1,6 +1,9 @@
+import asyncio
 import json
 import os
+import time
 from datetime import datetime
+from functools import partial
 from dateutil.relativedelta import relativedelta
 from decimal import Decimal, DecimalException
 from urllib.parse import urlparse
@@ -9,10 +12,14 @@ import discord
 from discord.ext import tasks, commands
 from urllib.request import urlopen, Request
 from web3 import Web3
-from web3.logs import DISCARD
+from sqlalchemy.dialects.sqlite import insert
 
-from bot.utils import fetch_abi, list_cogs, shift
+from bot.fixedpoint import ratio
+from bot.metrics import metrics
+from bot.persistence import Database
+from bot.utils import fetch_abi, list_cogs, prefetch_abis, shift
 from bot.bot import Bot
+from boardroombot.commands.models import boardroom as models
 
 
 class BoardroomBot(Bot):
@@ -21,16 +28,24 @@ class BoardroomBot(Bot):
     nickname = ''
     epoch = ''
     next_epoch = ''
+    next_epoch_point = None
     epoch_price = None
+    max_supply_expansion = None
     cash_per_share = None
     burnable_cash = None
     filter_lastblock = None
+    cursor_loaded = False
+    events_epoch = None
+    stats_cache = None
 
     def __init__(self, config, common, boardroom):
         super().__init__(config, common, None, list_cogs('commands', __file__))
         self.config = config
         self.boardroom = boardroom
 
+        prefetch_abis([boardroom[name] for name in (
+            'cash', 'cash_lp', 'share', 'share_lp', 'bond', 'rewards', 'treasury', 'boardroom')],
+            config.get('bscscan_api_key'))
         self.contracts['cash'] = self.web3.eth.contract(
             address=self.boardroom['cash'], abi=fetch_abi(boardroom['cash']))
         self.contracts['cash_lp'] = self.web3.eth.contract(
@@ -48,44 +63,118 @@ class BoardroomBot(Bot):
         self.contracts['boardroom'] = self.web3.eth.contract(
             address=self.boardroom['boardroom'], abi=fetch_abi(boardroom['boardroom']))
 
-        if not self.boardroom.get('cash_decimals'):
-            self.boardroom['cash_decimals'] = self.contracts['cash'].functions.decimals(
-            ).call()
-        if not self.boardroom.get('share_decimals'):
-            self.boardroom['share_decimals'] = self.contracts['share'].functions.decimals(
-            ).call()
-        if not self.boardroom.get('bond_decimals'):
-            self.boardroom['bond_decimals'] = self.contracts['bond'].functions.decimals(
-            ).call()
-
-        # cache constants
+        # immutable, so read once per contract and kept on disk across restarts
+        reads = {
+            'treasury_gameFundSharedPercent': self.contracts['treasury'].functions.gameFundSharedPercent(),
+            'treasury_PERIOD': self.contracts['treasury'].functions.PERIOD(),
+            'rewards_startBlock': self.contracts['rewards'].functions.startBlock(),
+            'rewards_TOTAL_REWARDS': self.contracts['rewards'].functions.TOTAL_REWARDS()
+        }
+        for name in ('cash', 'share', 'bond'):
+            if not self.boardroom.get(f'{name}_decimals'):
+                reads[f'{name}_decimals'] = self.contracts[name].functions.decimals()
+        constants = self.chain.read_constants(reads)
+
+        for name in ('cash', 'share', 'bond'):
+            if not self.boardroom.get(f'{name}_decimals'):
+                self.boardroom[f'{name}_decimals'] = constants[f'{name}_decimals']
+
         self.boardroom['treasury_gameFundSharedPercent'] = Decimal(
-            self.contracts['treasury'].functions.gameFundSharedPercent().call())
-        self.boardroom['treasury_PERIOD'] = self.contracts['treasury'].functions.PERIOD(
-        ).call()
-        self.boardroom['rewards_startBlock'] = self.contracts['rewards'].functions.startBlock(
-        ).call()
-        self.boardroom['rewards_TOTAL_REWARDS'] = shift(Decimal(self.contracts['rewards'].functions.TOTAL_REWARDS(
-        ).call()), -self.boardroom['share_decimals'])
-
-        self.filter_lastblock = self.web3.eth.block_number
-
-    def get_epoch(self):
-        self.epoch = self.contracts['treasury'].functions.epoch().call()
+            constants['treasury_gameFundSharedPercent'])
+        self.boardroom['treasury_PERIOD'] = constants['treasury_PERIOD']
+        self.boardroom['rewards_startBlock'] = constants['rewards_startBlock']
+        self.boardroom['rewards_TOTAL_REWARDS'] = shift(Decimal(
+            constants['rewards_TOTAL_REWARDS']), -self.boardroom['share_decimals'])
+
+        self.database = Database.shared(
+            config.get('database', 'sqlite:///pricebot.db'),
+            config.get('sql_echo', False), config.get('db_max_pending', 1000))
+        models.Base.metadata.create_all(self.database.engine)
+
+        # events are only scanned once they are this deep, so a reorg can't
+        # take back one that was already stored and announced
+        self.confirmations = config.get('reorg_depth', 15)
+
+    async def close(self):
+        await super().close()
+        self.database.release()
+
+    def load_cursor(self, session):
+        cursor = session.query(models.EventCursor).get(self.boardroom['treasury'])
+        return cursor.block_number if cursor else None
+
+    def store_events(self, rows, next_block, session):
+        # the events and the cursor past them commit together
+        if rows:
+            session.execute(insert(models.SeigniorageEvent.__table__).on_conflict_do_nothing(), rows)
+        session.execute(insert(models.EventCursor.__table__).on_conflict_do_update(
+            index_elements=['treasury'], set_={'block_number': next_block}),
+            {'treasury': self.boardroom['treasury'], 'block_number': next_block})
+
+    def get_epoch_clock(self, block_number):
+        treasury = self.contracts['treasury']
+        values = self.read({'epoch': treasury.functions.epoch(),
+                            'next_epoch_point': treasury.functions.nextEpochPoint()},
+                           block_identifier=block_number)
+        start_time = values['next_epoch_point'] - values['epoch'] * self.boardroom['treasury_PERIOD']
+        return (values['epoch'], start_time)
+
+    def get_event_epochs(self, events, epoch, start_time):
+        """The epoch each allocation moved the treasury to, from its timestamp:
+        nodes only keep recent state, so it can't be read at the event's block."""
+        period = self.boardroom['treasury_PERIOD']
+        epochs = {}
+        for event in sorted(events, key=lambda event: (event.blockNumber, event.logIndex), reverse=True):
+            # a late allocation still comes an epoch before the next one
+            epoch = min((event.args.timestamp - start_time) // period + 1, epoch)
+            epochs[(event.blockNumber, event.logIndex)] = epoch
+            epoch -= 1
+        return epochs
+
+    def epoch_reads(self):
+        treasury = self.contracts['treasury']
+        return {
+            'epoch': treasury.functions.epoch(),
+            'next_epoch_point': treasury.functions.nextEpochPoint(),
+            'dollar_price': treasury.functions.getDollarPrice(),
+            'max_supply_expansion': treasury.functions.maxSupplyExpansionPercent()
+        }
+
+    def supply_reads(self):
+        reads = {
+            'cash_supply': self.contracts['cash'].functions.totalSupply(),
+            'seigniorage_saved': self.contracts['treasury'].functions.seigniorageSaved(),
+            'boardroom_stake': self.contracts['boardroom'].functions.totalSupply()
+        }
+        if self.epoch_price <= Decimal(1):
+            reads['burnable_cash'] = self.contracts['treasury'].functions.getBurnableDollarLeft()
+        return reads
+
+    def epoch_countdown(self):
         epoch_time_delta = relativedelta(datetime.utcnow(),
-                                         datetime.utcfromtimestamp(self.contracts['treasury'].functions.nextEpochPoint().call()))
-        self.next_epoch = f"in {abs(epoch_time_delta.hours)}h {abs(epoch_time_delta.minutes)}m"
-
-        self.epoch_price = shift(Decimal(self.contracts['treasury'].functions.getDollarPrice().call(
-        )), -self.boardroom['cash_decimals'])
-        self.total_cash_supply = shift(Decimal(self.contracts['cash'].functions.totalSupply().call(
-        )) - Decimal(self.contracts['treasury'].functions.seigniorageSaved().call()), -self.boardroom['cash_decimals'])
-        self.boardroom_stake = shift(Decimal(self.contracts['boardroom'].functions.totalSupply().call(
-        )), -self.boardroom['share_decimals'])
+                                         datetime.utcfromtimestamp(self.next_epoch_point))
+        return f"in {abs(epoch_time_delta.hours)}h {abs(epoch_time_delta.minutes)}m"
+
+    def get_epoch(self, refresh=False):
+        # the epoch, its TWAP and the expansion cap only change when the treasury
+        # allocates seigniorage, which it can't do before nextEpochPoint
+        if refresh or self.next_epoch_point is None or time.time() >= self.next_epoch_point:
+            values = self.read(self.epoch_reads())
+            self.epoch = values['epoch']
+            self.next_epoch_point = values['next_epoch_point']
+            self.epoch_price = shift(Decimal(values['dollar_price']), -self.boardroom['cash_decimals'])
+            self.max_supply_expansion = Decimal(values['max_supply_expansion']) / Decimal(10000)
+        self.next_epoch = self.epoch_countdown()
+
+        # supplies move with every block; the snapshot cache answers repeat reads
+        # until the block advances
+        values = self.read(self.supply_reads())
+        self.total_cash_supply = shift(Decimal(values['cash_supply']) - Decimal(values['seigniorage_saved']),
+                                       -self.boardroom['cash_decimals'])
+        self.boardroom_stake = shift(Decimal(values['boardroom_stake']), -self.boardroom['share_decimals'])
 
         if self.epoch_price > Decimal(1):
-            expansion_rate = min(self.epoch_price - Decimal(1), Decimal(
-                self.contracts['treasury'].functions.maxSupplyExpansionPercent().call()) / Decimal(10000))
+            expansion_rate = min(self.epoch_price - Decimal(1), self.max_supply_expansion)
             seigniorage_amount = self.total_cash_supply * expansion_rate
             boardroom_amount = seigniorage_amount * \
                 (Decimal(
@@ -93,8 +182,7 @@ class BoardroomBot(Bot):
             self.cash_per_share = boardroom_amount / self.boardroom_stake
             self.burnable_cash = None
         else:
-            self.burnable_cash = shift(Decimal(self.contracts['treasury'].functions.getBurnableDollarLeft().call(
-            )), -self.boardroom['cash_decimals'])
+            self.burnable_cash = shift(Decimal(values['burnable_cash']), -self.boardroom['cash_decimals'])
             self.cash_per_share = None
 
     def generate_presence(self):
@@ -109,46 +197,98 @@ class BoardroomBot(Bot):
     def generate_nickname(self):
         return f"Epoch {self.epoch+1} {self.next_epoch}"
 
+    def stats_reads(self):
+        """Every contract read generate_stats needs, executed as one batch."""
+        bnb, cash, share, bond = (self.contracts[name]
+                                  for name in ('bnb', 'cash', 'share', 'bond'))
+        cash_lp, share_lp, rewards = (self.contracts[name]
+                                      for name in ('cash_lp', 'share_lp', 'rewards'))
+
+        reads = {
+            **self.bnb_price_reads(self.amm['address']),
+
+            # amounts in LPs
+            'cash_lp_bnb': bnb.functions.balanceOf(self.boardroom['cash_lp']),
+            'cash_lp_cash': cash.functions.balanceOf(self.boardroom['cash_lp']),
+            'share_lp_bnb': bnb.functions.balanceOf(self.boardroom['share_lp']),
+            'share_lp_share': share.functions.balanceOf(self.boardroom['share_lp']),
+
+            # share supply
+            'share_supply': share.functions.totalSupply(),
+            'unclaimed_treasury_fund': share.functions.unclaimedTreasuryFund(),
+            'unclaimed_dev_fund': share.functions.unclaimedDevFund(),
+            'generated_reward': rewards.functions.getGeneratedReward(
+                self.boardroom['rewards_startBlock'], self.filter_lastblock or self.block_number),
+
+            # LPs staked in rewards
+            'cash_lp_supply': cash_lp.functions.totalSupply(),
+            'rewards_cash_lp': cash_lp.functions.balanceOf(self.boardroom['rewards']),
+            'share_lp_supply': share_lp.functions.totalSupply(),
+            'rewards_share_lp': share_lp.functions.balanceOf(self.boardroom['rewards']),
+
+            'bond_supply': bond.functions.totalSupply()
+        }
+
+        for fund in ('game_fund', 'community_fund', 'dev_fund'):
+            address = self.boardroom[fund]
+            reads.update({
+                f'{fund}_cash': cash.functions.balanceOf(address),
+                f'{fund}_share': share.functions.balanceOf(address),
+                f'{fund}_cash_lp': cash_lp.functions.balanceOf(address),
+                f'{fund}_share_lp': share_lp.functions.balanceOf(address),
+                f'{fund}_cash_lp_staked': rewards.functions.balanceOf(0, address),
+                f'{fund}_cash_lp_rewards': rewards.functions.pendingRewards(0, address),
+                f'{fund}_share_lp_staked': rewards.functions.balanceOf(1, address),
+                f'{fund}_share_lp_rewards': rewards.functions.pendingRewards(1, address)
+            })
+
+        return reads
+
     def generate_stats(self):
-        self.get_bnb_price(self.amm['address'])
+        if not (self.filter_lastblock or self.block_number):
+            self.block_number = self.web3.eth.block_number
+
+        values = self.read(self.stats_reads())
+        cash_decimals = self.boardroom['cash_decimals']
+        share_decimals = self.boardroom['share_decimals']
+
+        self.set_bnb_price(values)
 
         # amounts in LPs
-        (self.cash_lp_bnb_amount, self.cash_lp_token_amount) = self.get_lp_amounts(
-            self.contracts['cash'], self.boardroom['cash_lp'], self.boardroom["cash_decimals"])
-        self.cash_price = self.cash_lp_bnb_amount / self.cash_lp_token_amount
-        (self.share_lp_bnb_amount, self.share_lp_token_amount) = self.get_lp_amounts(
-            self.contracts['share'], self.boardroom['share_lp'], self.boardroom["share_decimals"])
-        self.share_price = self.share_lp_bnb_amount / self.share_lp_token_amount
+        self.cash_lp_bnb_amount = shift(Decimal(values['cash_lp_bnb']), -18)
+        self.cash_lp_token_amount = shift(
+            Decimal(values['cash_lp_cash']), -cash_decimals)
+        self.cash_price = ratio(
+            values['cash_lp_bnb'], 18, values['cash_lp_cash'], cash_decimals)
+        self.share_lp_bnb_amount = shift(Decimal(values['share_lp_bnb']), -18)
+        self.share_lp_token_amount = shift(
+            Decimal(values['share_lp_share']), -share_decimals)
+        self.share_price = ratio(
+            values['share_lp_bnb'], 18, values['share_lp_share'], share_decimals)
 
         # share supply = (totalSupply - total rewards) + unclaimed funds + generated rewards
         total_share_supply = shift(
-            Decimal(self.contracts['share'].functions.totalSupply().call()) +
-            Decimal(self.contracts['share'].functions.unclaimedTreasuryFund().call()) +
-            Decimal(
-                self.contracts['share'].functions.unclaimedDevFund().call()) +
-            Decimal(
-                self.contracts['rewards'].functions.getGeneratedReward(self.boardroom['rewards_startBlock'], self.filter_lastblock).call()), -self.boardroom['share_decimals']) - self.boardroom['rewards_TOTAL_REWARDS']
+            Decimal(values['share_supply']) +
+            Decimal(values['unclaimed_treasury_fund']) +
+            Decimal(values['unclaimed_dev_fund']) +
+            Decimal(values['generated_reward']), -share_decimals) - self.boardroom['rewards_TOTAL_REWARDS']
 
         # LPs staked in rewards
-        total_cash_lp_supply = shift(Decimal(
-            self.contracts['cash_lp'].functions.totalSupply().call()), -18)
-        rewards_cash_lp = shift(Decimal(self.contracts['cash_lp'].functions.balanceOf(
-            self.boardroom['rewards']).call()), -18)
+        total_cash_lp_supply = shift(Decimal(values['cash_lp_supply']), -18)
+        rewards_cash_lp = shift(Decimal(values['rewards_cash_lp']), -18)
         rewards_cash_lp_pct = rewards_cash_lp / total_cash_lp_supply
         rewards_cash_lp_value = (
             self.cash_lp_token_amount * self.cash_price + self.cash_lp_bnb_amount) * rewards_cash_lp_pct
 
-        total_share_lp_supply = shift(Decimal(
-            self.contracts['share_lp'].functions.totalSupply().call()), -18)
-        rewards_share_lp = shift(Decimal(self.contracts['share_lp'].functions.balanceOf(
-            self.boardroom['rewards']).call()), -18)
+        total_share_lp_supply = shift(Decimal(values['share_lp_supply']), -18)
+        rewards_share_lp = shift(Decimal(values['rewards_share_lp']), -18)
         rewards_share_lp_pct = rewards_share_lp / total_share_lp_supply
         rewards_share_lp_value = (
             self.share_lp_token_amount * self.share_price + self.share_lp_bnb_amount) * rewards_share_lp_pct
 
         # bonds
         total_bond_supply = shift(
-            Decimal(self.contracts['bond'].functions.totalSupply().call()), -self.boardroom['bond_decimals'])
+            Decimal(values['bond_supply']), -self.boardroom['bond_decimals'])
         debt_ratio = total_bond_supply / self.total_cash_supply
 
         cash_mc = self.total_cash_supply * self.cash_price
@@ -166,40 +306,34 @@ class BoardroomBot(Bot):
             expansion_or_contraction_stats = f"SoupB Available:     {self.burnable_cash:,.2f}"
 
         # get busd value of all cash, shares (incl. rewards), LPs
-        def get_all_balance(address):
-            cash = shift(Decimal(self.contracts['cash'].functions.balanceOf(
-                address).call()), -self.boardroom['cash_decimals'])
-            share = shift(Decimal(self.contracts['share'].functions.balanceOf(
-                address).call()), -self.boardroom['share_decimals'])
-            cash_lp = shift(
-                Decimal(self.contracts['cash_lp'].functions.balanceOf(address).call()), -18)
-            share_lp = shift(
-                Decimal(self.contracts['share_lp'].functions.balanceOf(address).call()), -18)
-
-            cash_lp_staked = shift(Decimal(self.contracts['rewards'].functions.balanceOf(
-                0, address).call()), -18)
+        def get_all_balance(fund):
+            cash = shift(Decimal(values[f'{fund}_cash']), -cash_decimals)
+            share = shift(Decimal(values[f'{fund}_share']), -share_decimals)
+            cash_lp = shift(Decimal(values[f'{fund}_cash_lp']), -18)
+            share_lp = shift(Decimal(values[f'{fund}_share_lp']), -18)
+
+            cash_lp_staked = shift(
+                Decimal(values[f'{fund}_cash_lp_staked']), -18)
             cash_lp_total_bnb = self.cash_lp_bnb_amount * 2 / \
                 total_cash_lp_supply * (cash_lp + cash_lp_staked)
             cash_lp_rewards = shift(
-                Decimal(self.contracts['rewards'].functions.pendingRewards(
-                    0, address).call()), -self.boardroom['share_decimals'])
+                Decimal(values[f'{fund}_cash_lp_rewards']), -share_decimals)
 
-            share_lp_staked = shift(Decimal(self.contracts['rewards'].functions.balanceOf(
-                1, address).call()), -18)
+            share_lp_staked = shift(
+                Decimal(values[f'{fund}_share_lp_staked']), -18)
             share_lp_total_bnb = self.share_lp_bnb_amount * 2 / \
                 total_share_lp_supply * (share_lp + share_lp_staked)
             share_lp_rewards = shift(
-                Decimal(self.contracts['rewards'].functions.pendingRewards(
-                    1, address).call()), -self.boardroom['share_decimals'])
+                Decimal(values[f'{fund}_share_lp_rewards']), -share_decimals)
 
             cash_total_bnb = cash * self.cash_price
             share_total_bnb = (share + cash_lp_rewards +
                                share_lp_rewards) * self.share_price
             return self.bnb_price * (cash_total_bnb + share_total_bnb + cash_lp_total_bnb + share_lp_total_bnb)
 
-        game_fund = get_all_balance(self.boardroom['game_fund'])
-        community_fund = get_all_balance(self.boardroom['community_fund'])
-        dev_fund = get_all_balance(self.boardroom['dev_fund'])
+        game_fund = get_all_balance('game_fund')
+        community_fund = get_all_balance('community_fund')
+        dev_fund = get_all_balance('dev_fund')
 
         description = f""":notepad_spiral: **The Latest Soup** :notepad_spiral:
 ```
@@ -229,58 +363,102 @@ Dev Fund:            ${dev_fund:,.0f}
 ```"""
         return description
 
+    async def get_stats(self):
+        # one render per block and epoch, however many commands ask for it
+        if self.stats_cache:
+            (rendered, epoch, stats) = self.stats_cache
+            if epoch == self.epoch and time.monotonic() - rendered < self.chain.snapshots.max_age:
+                return stats
+
+        stats = await self.run_rpc(self.generate_stats)  # concurrent renders share one
+        self.stats_cache = (time.monotonic(), self.epoch, stats)
+        return stats
+
+    def get_seigniorage_logs(self, from_block, to_block):
+        return self.contracts['treasury'].events.BoilerFunded().getLogs(
+            fromBlock=from_block, toBlock=to_block)
+
     async def get_latest_events(self):
-        to_block = self.web3.eth.block_number
-        print('from', self.filter_lastblock, 'to', to_block)
-
-        method_id = self.web3.keccak(text="allocateSeigniorage()")[0:4].hex()
-
-        timestamp, title, description = None, None, None
-        for block_number in range(self.filter_lastblock, to_block):
-            block = self.web3.eth.get_block(
-                block_number, full_transactions=True)
-            for tx in block.transactions:
-                if tx.to == self.boardroom['treasury'] and tx.input == method_id:
-                    receipt = self.web3.eth.getTransactionReceipt(tx.hash)
-                    seigniorage_event = self.contracts['treasury'].events.BoilerFunded(
-                    ).processReceipt(receipt, errors=DISCARD)
-                    print(receipt)
-
-                    self.get_epoch()  # refresh epoch data
-
-                    if seigniorage_event:
-                        timestamp = datetime.utcfromtimestamp(
-                            seigniorage_event[0].args.timestamp)
-                        seigniorage = shift(Decimal(
-                            seigniorage_event[0].args.seigniorage), -self.boardroom['cash_decimals'])
-
-                        title = ':fondue::fondue::fondue: **Soup has been served!** :fondue::fondue::fondue:'
-                        description = f"""```
+        head = await self.run_rpc(lambda: self.web3.eth.block_number)
+        to_block = head - self.confirmations
+        if not self.cursor_loaded:
+            self.filter_lastblock = await self.database.run(self.load_cursor)
+            self.cursor_loaded = True
+        if self.filter_lastblock is None:
+            self.filter_lastblock = to_block
+        if to_block < self.filter_lastblock:
+            return
+
+        metrics.set('bot_events_catchup_blocks', to_block - self.filter_lastblock + 1,
+                    bot=self.common['name'])
+
+        # split catch-up into ranges the node will serve, and fetch them in parallel
+        chunk_size = self.config.get('log_chunk_size', 5000)
+        chunks = await asyncio.gather(*(
+            self.run_rpc(self.get_seigniorage_logs, start,
+                         min(start + chunk_size - 1, to_block))
+            for start in range(self.filter_lastblock, to_block + 1, chunk_size)))
+        seigniorage_events = [log for chunk in chunks for log in chunk]
+
+        # contraction epochs don't emit BoilerFunded, so watch the epoch counter too
+        (epoch, start_time) = await self.run_rpc(self.get_epoch_clock, to_block)
+        epoch_changed = self.events_epoch is not None and epoch != self.events_epoch
+
+        event_epochs = self.get_event_epochs(seigniorage_events, epoch, start_time)
+        rows = [{
+            'treasury': self.boardroom['treasury'],
+            'epoch': event_epochs[(event.blockNumber, event.logIndex)],
+            'block_number': event.blockNumber,
+            'transaction_hash': event.transactionHash.hex(),
+            'log_index': event.logIndex,
+            'timestamp': datetime.utcfromtimestamp(event.args.timestamp),
+            'seigniorage': float(shift(Decimal(event.args.seigniorage), -self.boardroom['cash_decimals']))
+        } for event in seigniorage_events]
+
+        # the cursor only moves once the events before it are on disk
+        try:
+            await self.database.run(partial(self.store_events, rows, to_block + 1))
+        except Exception as e:
+            print(f"Saving {self.common['name']} events failed, rescanning them next time:", repr(e))
+            return
+        self.filter_lastblock = to_block + 1
+        self.events_epoch = epoch
+
+        if not seigniorage_events and not epoch_changed:
+            return
+
+        await self.run_rpc(self.get_epoch, refresh=True)  # refresh epoch data
+        stats = await self.get_stats()
+
+        if seigniorage_events:
+            seigniorage_event = seigniorage_events[-1]
+            timestamp = datetime.utcfromtimestamp(
+                seigniorage_event.args.timestamp)
+            seigniorage = shift(Decimal(
+                seigniorage_event.args.seigniorage), -self.boardroom['cash_decimals'])
+
+            title = ':fondue::fondue::fondue: **Soup has been served!** :fondue::fondue::fondue:'
+            description = f"""```
 Epoch {self.epoch}
 Fresh hot Soup: {seigniorage:.2f}
 Soup per Soups: {(seigniorage / self.boardroom_stake):.4f}
 ```
-{self.generate_stats()}
+{stats}
 """
-                    else:
-                        timestamp = datetime.utcfromtimestamp(
-                            block.timestamp)
+        else:
+            timestamp = datetime.utcnow()
 
-                        title = '**No Soup has been served**'
-                        description = f"""```
+            title = '**No Soup has been served**'
+            description = f"""```
 Epoch {self.epoch}
 ```
-{self.generate_stats()}
+{stats}
 """
-                    break
-
-        self.filter_lastblock = to_block + 1
 
-        if timestamp:
-            embed = discord.Embed(color=discord.Color.green(),
-                                  title=title, description=description, timestamp=timestamp)
+        embed = discord.Embed(color=discord.Color.green(),
+                              title=title, description=description, timestamp=timestamp)
 
-            for channel_id in self.boardroom['stats_channels']:
-                channel = self.get_channel(channel_id)
-                if channel:
-                    await channel.send(embed=embed)
+        for channel_id in self.boardroom['stats_channels']:
+            channel = self.get_channel(channel_id)
+            if channel:
+                await channel.send(embed=embed)
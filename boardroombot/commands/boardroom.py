@@ -1,13 +1,21 @@
 import math
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 
 import discord
 from discord.ext import tasks, commands
 from decimal import Decimal, DecimalException
 from web3 import Web3
+from sqlalchemy.sql import func
+
+from bot.metrics import metrics
+from boardroombot.commands.models import boardroom as models
 
 
 class Boardroom(commands.Cog, command_attrs=dict(hidden=True)):
+    epoch_schedule = None
+    events_schedule = None
+
     def __init__(self, bot):
         self.bot = bot
 
@@ -15,38 +23,106 @@ class Boardroom(commands.Cog, command_attrs=dict(hidden=True)):
     async def on_ready(self):
         await self.update()
 
-        self.bot.epoch_loop = tasks.loop(
-            seconds=self.bot.config['refresh_rate'])(self.update)
+        # the nickname counts down in minutes, so it is refreshed at least every minute
+        refresh_rate = self.bot.config['refresh_rate']
+        self.epoch_schedule = self.bot.schedule('epoch_loop', refresh_rate, 60)
+        self.bot.epoch_loop = tasks.loop(seconds=self.epoch_schedule.min_interval)(self.bot.follow_blocks(
+            metrics.loop('epoch_loop', lambda: self.epoch_schedule.interval, self.update,
+                         bot=self.bot.common['name']), refresh_rate, self.epoch_schedule))
         self.bot.epoch_loop.add_exception_type(discord.errors.HTTPException)
         self.bot.epoch_loop.add_exception_type(ValueError)
         self.bot.epoch_loop.start()
 
         if 'stats_channels' in self.bot.boardroom:
-            refresh_rate = self.bot.common.get(
-                'refresh_rate', self.bot.config['refresh_rate'])
-            self.bot.events_loop = tasks.loop(
-                seconds=refresh_rate)(self.bot.get_latest_events)
+            self.events_refresh_rate = self.bot.common.get('refresh_rate', self.bot.config['refresh_rate'])
+            self.events_schedule = self.bot.schedule('events_loop', self.events_refresh_rate)
+            self.bot.events_loop = tasks.loop(seconds=self.events_schedule.min_interval)(
+                self.events_schedule.wrap(metrics.loop(
+                    'events_loop', lambda: self.events_schedule.interval, self.check_events,
+                    bot=self.bot.common['name'])))
             self.bot.events_loop.add_exception_type(
                 discord.errors.HTTPException)
             self.bot.events_loop.add_exception_type(ValueError)
             self.bot.events_loop.start()
 
     async def update(self):
-        self.bot.get_epoch()
+        await self.bot.run_rpc(self.bot.get_epoch)
+        if self.epoch_schedule:
+            self.epoch_schedule.record(self.bot.cash_per_share or self.bot.burnable_cash,
+                                       self.bot.block_number)
 
-        for guild in self.bot.guilds:
-            await guild.me.edit(nick=self.bot.generate_nickname())
+        self.bot.publisher.publish_nickname(self.bot.generate_nickname())
 
         presence = self.bot.generate_presence()
         if presence:
-            await self.bot.change_presence(activity=discord.Game(name=presence))
+            self.bot.publisher.publish_presence(presence)
+
+    async def check_events(self):
+        await self.bot.get_latest_events()
+
+        # seigniorage can't be allocated before the next epoch point, and is only
+        # scanned once it is confirmed, so there is nothing to look for until then.
+        # Past it, look every refresh_rate until someone allocates
+        if self.bot.next_epoch_point:
+            # BSC's 3s blocks until the scheduler has measured them
+            confirmed = self.bot.confirmations * (self.bot.chain.scheduler.block_time or 3)
+            wait = self.bot.next_epoch_point - time.time() + confirmed
+            self.events_schedule.run_at(time.monotonic() + max(wait, self.events_refresh_rate))
 
     @commands.command(help='Display statistics')
     async def stats(self, ctx: commands.Context):
         async with ctx.typing():
-            stats = self.bot.generate_stats()
+            stats = await self.bot.get_stats()
             await ctx.channel.send(stats)
 
+    def load_epochs(self, session):
+        event = models.SeigniorageEvent
+        query = session.query(event).filter(event.treasury == self.bot.boardroom['treasury'])
+        aggregates = (func.count(event.id), func.sum(event.seigniorage),
+                      func.avg(event.seigniorage), func.max(event.seigniorage))
+
+        week = query.filter(event.timestamp >= datetime.utcnow() - timedelta(days=7))
+        return {
+            'all': query.with_entities(*aggregates).one(),
+            'week': week.with_entities(*aggregates).one(),
+            'epochs': [epoch for (epoch,) in query.with_entities(event.epoch).distinct().order_by(event.epoch)]
+        }
+
+    @staticmethod
+    def expansion_streaks(epochs, current_epoch):
+        """The longest run of consecutive expansion epochs, and the run that is
+        still going at `current_epoch`."""
+        (longest, streak, previous) = (0, 0, None)
+        for epoch in epochs:
+            streak = streak + 1 if previous is not None and epoch == previous + 1 else 1
+            longest = max(longest, streak)
+            previous = epoch
+
+        return (longest, streak if previous == current_epoch else 0)
+
+    @commands.command(help='Display seigniorage history')
+    async def epochs(self, ctx: commands.Context):
+        history = await self.bot.database.run(self.load_epochs)
+        if not history['epochs']:
+            return await ctx.channel.send('No Soup has been served yet!')
+
+        (count, total, average, largest) = history['all']
+        (week_count, week_total, week_average, _) = history['week']
+        (longest, current) = self.expansion_streaks(history['epochs'], self.bot.epoch)
+        since = history['epochs'][0]
+        epochs = max(self.bot.epoch - since + 1, count) if self.bot.epoch else count
+
+        await ctx.channel.send(f""":notepad_spiral: **Soup History** :notepad_spiral:
+```
+Expansions:          {count} of {epochs} epochs since epoch {since}
+Total Soup Served:   {total:,.2f}
+Average per Serving: {average:,.2f}
+Largest Serving:     {largest:,.2f}
+Last 7 Days:         {week_count} servings, {week_total or 0:,.2f} total, {week_average or 0:,.2f} average
+Current Streak:      {current} epochs
+Longest Streak:      {longest} epochs
+```""")
+
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
         if isinstance(error, commands.CommandNotFound) or isinstance(error, commands.CheckFailure):
@@ -0,0 +1,32 @@
+from sqlalchemy import *  # func, Table, Column, Boolean, BigInteger, Binary, DateTime, Integer, Float, String
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+
+class EventCursor(Base):
+    __tablename__ = 'event_cursor'
+
+    treasury = Column(String, primary_key=True)
+    block_number = Column(Integer, nullable=False)  # the next block to scan
+
+    def __repr__(self):
+        return f"<Events for {self.treasury} scanned up to block {self.block_number}>"
+
+
+class SeigniorageEvent(Base):
+    __tablename__ = 'seigniorage_event'
+    __table_args__ = (UniqueConstraint('transaction_hash', 'log_index'),
+                      Index('ix_seigniorage_event_treasury_epoch', 'treasury', 'epoch'))
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    treasury = Column(String, nullable=False)
+    epoch = Column(Integer, nullable=False)
+    block_number = Column(Integer, nullable=False)
+    transaction_hash = Column(String, nullable=False)
+    log_index = Column(Integer, nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    seigniorage = Column(Float, nullable=False)
+
+    def __repr__(self):
+        return f"<Seigniorage of {self.seigniorage} in epoch {self.epoch} of {str(self.treasury)}>"
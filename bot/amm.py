@@ -0,0 +1,32 @@
+from bot.fixedpoint import ratio
+
+FEE_DENOMINATOR = 10000  # fees are in basis points
+
+
+def amount_out(amount_in, reserve_in, reserve_out, fee=25):
+    """What a UniswapV2-style pair pays out for amount_in, to the wei,
+    as its getAmountOut would."""
+    if amount_in <= 0 or reserve_in <= 0 or reserve_out <= 0:
+        return 0
+
+    amount_in_with_fee = amount_in * (FEE_DENOMINATOR - fee)
+    return amount_in_with_fee * reserve_out // (reserve_in * FEE_DENOMINATOR + amount_in_with_fee)
+
+
+def price_impact(amount_in, amount_out, reserve_in, reserve_out):
+    """How much worse than the mid-price a trade fills, fee included."""
+    if amount_in <= 0 or reserve_out <= 0:
+        return 0
+
+    # fill price over mid-price is (out / in) / (reserve_out / reserve_in)
+    return 1 - ratio(amount_out * reserve_in, 0, amount_in * reserve_out, 0)
+
+
+def ladder(sizes, reserve_in, reserve_out, fee=25):
+    """Quotes every trade size against the same reserves, returning
+    (amount_in, amount_out, price_impact) for each."""
+    quotes = []
+    for amount_in in sizes:
+        out = amount_out(amount_in, reserve_in, reserve_out, fee)
+        quotes.append((amount_in, out, price_impact(amount_in, out, reserve_in, reserve_out)))
+    return quotes
@@ -1,16 +1,21 @@
+import asyncio
 import json
 import os
+import time
 from decimal import Decimal, DecimalException
-from urllib.parse import urlparse
 from itertools import chain
 
 import discord
 from discord.ext import tasks, commands
 from urllib.request import urlopen, Request
-from web3 import Web3
-from web3.middleware import geth_poa_middleware
 
-from bot.utils import fetch_abi, list_cogs, shift
+from bot.chain import Chain
+from bot.cooldown import CommandQueue
+from bot.fixedpoint import ratio, to_decimal
+from bot.metrics import metrics
+from bot.pricebus import PriceBus
+from bot.publisher import Publisher
+from bot.utils import fetch_abi, list_cogs
 
 
 class Bot(commands.Bot):
@@ -19,6 +24,7 @@ class Bot(commands.Bot):
     config = {}
     nickname = ''
     bnb_price = 0
+    block_number = None
     token_abi = []
 
     # Static BSC contract addresses
@@ -35,30 +41,28 @@ class Bot(commands.Bot):
         self.commands = chain(list_cogs('commands'), extra_cogs)
         self.config = config
         self.common = common
-        self.token = token
+        self.token = token or {}
         self.amm = config['amm'][common['amm']]
 
         if not config['amm'].get(common['amm']):
             raise Exception(
                 f"{common['name']}'s AMM {common['amm']} does not exist!")
 
-        if node := config.get('bsc_node'):
-            bsc_node = urlparse(node)
-            if 'http' in bsc_node.scheme:
-                provider = Web3.HTTPProvider(node)
-            else:
-                provider = Web3.IPCProvider(bsc_node.path)
-
-            self.web3 = Web3(provider)  # type: Web3.eth.account
-            self.web3.middleware_onion.inject(geth_poa_middleware, layer=0)
-        else:
-            raise Exception("Required setting 'bsc_node' not configured!")
+        self.contracts = {}
+        self.chain = Chain.shared(config)
+        self.web3 = self.chain.web3
+        self.price_bus = PriceBus.shared(
+            config['price_bus'], config.get('price_bus_writer', False),
+            config.get('price_bus_slots', 64)) if config.get('price_bus') else None
+        self.publisher = Publisher(
+            self, config.get('publish_concurrency', 4),
+            config.get('nick_interval', 1), config.get('presence_interval', 5))
 
         quote_token = self.token.get('quote', 'bnb')
         if quote_token != 'bnb':
             print(f"Quote currency {quote_token} defaulting to $1")
 
-        self.token_abi = fetch_abi(self.address['bnb'])
+        self.token_abi = fetch_abi(self.address['bnb'], config.get('bscscan_api_key'))
         self.contracts['bnb'] = self.web3.eth.contract(
             address=self.address['bnb'], abi=self.token_abi)
         self.contracts['busd'] = self.web3.eth.contract(
@@ -67,45 +71,159 @@ class Bot(commands.Bot):
         self.help_command = commands.DefaultHelpCommand(
             command_attrs={"hidden": True})
 
+        self.command_queue = CommandQueue(
+            config.get('user_cooldown', 2), config.get('channel_cooldown', 0.5),
+            config.get('command_max_wait', 10))
+        self.before_invoke(self.before_command)
+        self.after_invoke(self.stop_command_timer)
+
     def get_amm(self, amm=None):
         if not amm:
             return self.amm
 
         return self.config['amm'].get(amm)
 
-    def get_bnb_price(self, lp):
-        bnb_amount = Decimal(
-            self.contracts['bnb'].functions.balanceOf(lp).call())
-        busd_amount = Decimal(
-            self.contracts['busd'].functions.balanceOf(lp).call())
+    def follow_blocks(self, coro, interval, schedule=None):
+        """With bsc_ws set, runs coro on every new block and returns a polling
+        fallback that only runs while no blocks have arrived for `interval`.
+        A schedule only paces the polling, never the new blocks."""
+        heads = self.chain.heads
+        if heads:
+            heads.subscribe(coro, self.config.get('head_debounce', 1))
+
+        async def poll():
+            if not heads or not heads.fresh(interval):
+                await coro()
+
+        return schedule.wrap(poll) if schedule else poll
+
+    def schedule(self, name, refresh_rate, max_interval=None):
+        """A schedule for a loop that would otherwise run every `refresh_rate`
+        seconds. With adaptive_refresh off, it keeps to refresh_rate unless the
+        RPC budget stretches it."""
+        if self.config.get('adaptive_refresh', True):
+            min_interval = min(self.config.get('min_refresh_rate', 3), refresh_rate)
+            slowest = self.config.get('max_refresh_rate', refresh_rate * 4)
+        else:
+            min_interval = slowest = refresh_rate
+
+        return self.chain.scheduler.schedule(
+            name, refresh_rate, min_interval, min(max_interval or slowest, slowest),
+            self.config.get('refresh_target_move', 0.002), bot=self.common['name'])
+
+    async def run_rpc(self, fn, *args, **kwargs):
+        return await self.chain.run(fn, *args, **kwargs)
+
+    def read(self, calls, block_identifier='latest', max_age=None):
+        (self.block_number, values) = self.chain.read(
+            calls, block_identifier, max_age)
+        return values
+
+    def bnb_price_reads(self, lp):
+        return {
+            'bnb_reserve': self.contracts['bnb'].functions.balanceOf(lp),
+            'busd_reserve': self.contracts['busd'].functions.balanceOf(lp)
+        }
 
-        self.bnb_price = Decimal(busd_amount) / Decimal(bnb_amount)
+    def set_bnb_price(self, values):
+        self.bnb_price = Decimal(
+            values['busd_reserve']) / Decimal(values['bnb_reserve'])
 
         return self.bnb_price
 
-    def get_lp_amounts(self, token_contract, native_lp, decimals):
-        quote_amount = shift(Decimal(
-            self.contracts[self.token.get('quote', 'bnb')].functions.balanceOf(native_lp).call()), -18)
-        token_amount = shift(Decimal(token_contract.functions.balanceOf(native_lp).call(
-        )), -decimals)
+    def lp_amount_reads(self, token_contract, native_lp):
+        return {
+            'quote_reserve': self.contracts[self.token.get('quote', 'bnb')].functions.balanceOf(native_lp),
+            'token_reserve': token_contract.functions.balanceOf(native_lp)
+        }
+
+    @staticmethod
+    def parse_lp_amounts(values, decimals):
+        quote_amount = to_decimal(values['quote_reserve'], 18)
+        token_amount = to_decimal(values['token_reserve'], decimals)
         return (quote_amount, token_amount)
 
-    def get_prices(self, token_contract, native_lp, bnb_lp, decimals):
-        (quote_amount, token_amount) = self.get_lp_amounts(
-            token_contract, native_lp, decimals)
+    def tracked_reserves(self, token_contract, native_lp, bnb_lp):
+        """The LP reserves get_prices needs, from the chain's Sync-driven
+        reserve tracker, or None if the pairs can't be tracked."""
+        if not self.chain.reserves:
+            return None
+
+        quote_token = self.token.get('quote', 'bnb')
+        wanted = {
+            'quote_reserve': (native_lp, self.contracts[quote_token].address),
+            'token_reserve': (native_lp, token_contract.address)
+        }
+        if quote_token == 'bnb':
+            wanted['bnb_reserve'] = (bnb_lp, self.address['bnb'])
+            wanted['busd_reserve'] = (bnb_lp, self.address['busd'])
+
+        values = self.chain.reserves.get(wanted)
+        if values is not None:
+            self.block_number = self.chain.reserves.block_number
+        return values
+
+    def bus_values(self, native_lp, bnb_lp, extra_reads):
+        """The values get_prices needs as the fetcher last published them, or
+        None if it hasn't published all of them recently."""
+        if not self.price_bus or self.price_bus.writer:
+            return None
+
+        published = self.price_bus.read(native_lp, bnb_lp, self.config.get('price_bus_max_age', 10))
+        needed = ['quote_reserve', 'token_reserve', *extra_reads]
+        if self.token.get('quote', 'bnb') == 'bnb':
+            needed += ['bnb_reserve', 'busd_reserve']
+        if published is None or any(key not in published[1] for key in needed):
+            metrics.inc('bot_price_bus_reads_total', outcome='miss')
+            return None
+
+        metrics.inc('bot_price_bus_reads_total', outcome='hit')
+        (block_number, values) = published
+
+        self.block_number = block_number
+        return values
+
+    def get_prices(self, token_contract, native_lp, bnb_lp, decimals, extra_reads={}):
+        # a reader takes everything from the fetcher's price bus. Otherwise LP
+        # reserves come from Sync events when the pairs can be tracked, or every
+        # read for the tick goes out in one multicall, pinned to one block. Reads
+        # another bot on this chain just made come from the snapshot cache instead
+        values = self.bus_values(native_lp, bnb_lp, extra_reads)
+        if values is None:
+            values = self.tracked_reserves(token_contract, native_lp, bnb_lp)
+            if values is None:
+                reads = {**extra_reads, **self.lp_amount_reads(token_contract, native_lp)}
+                if self.token.get('quote', 'bnb') == 'bnb':
+                    reads.update(self.bnb_price_reads(bnb_lp))
+                values = self.read(reads)
+            elif extra_reads:
+                # slow-moving values like supplies don't need a read every block
+                (_, extra_values) = self.chain.read(
+                    extra_reads, max_age=self.config.get('supply_max_age', 60))
+                values.update(extra_values)
+
+            if self.price_bus and self.price_bus.writer:
+                self.price_bus.write(native_lp, bnb_lp, self.block_number, values)
+
+        (quote_amount, token_amount) = self.parse_lp_amounts(values, decimals)
 
         try:
-            price_quote = quote_amount / token_amount
+            price_quote = ratio(
+                values['quote_reserve'], 18, values['token_reserve'], decimals)
         except ZeroDivisionError:
             price_quote = 0
 
         if self.token.get('quote', 'bnb') == 'bnb':
-            quote_price = self.get_bnb_price(bnb_lp)
+            quote_price = self.set_bnb_price(values)
         else:
             quote_price = 1
 
         price_busd = price_quote * quote_price
         return {
+            **{key: values[key] for key in extra_reads},
+            'block_number': self.block_number,
+            'quote_reserve': values['quote_reserve'],
+            'token_reserve': values['token_reserve'],
             'quote_amount': quote_amount,
             'token_amount': token_amount,
             'price_quote': price_quote,
@@ -125,7 +243,7 @@ class Bot(commands.Bot):
         pass
 
     async def on_guild_join(self, guild):
-        await guild.me.edit(nick=self.nickname)
+        self.publisher.publish_guild(guild)
 
     async def check_restrictions(self, ctx):
         server_restriction = self.config.get(
@@ -157,6 +275,16 @@ class Bot(commands.Bot):
 
         return val
 
+    @staticmethod
+    def parse_period(val):
+        units = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+        try:
+            val = int(val[:-1]) * units[val[-1].lower()]
+        except (KeyError, ValueError, IndexError):
+            val = None
+
+        return val
+
     @staticmethod
     def parse_decimal(val):
         try:
@@ -166,7 +294,59 @@ class Bot(commands.Bot):
 
         return val
 
-    def exec(self):
+    async def before_command(self, ctx):
+        # a group's hooks run again for its subcommand; queue it only once
+        if hasattr(ctx, 'started'):
+            return
+        ctx.started = time.perf_counter()
+        await self.command_queue.wait(ctx)
+
+    async def stop_command_timer(self, ctx):
+        if isinstance(ctx.command, commands.Group) and ctx.invoked_subcommand and not ctx.command_failed:
+            return  # timed once its subcommand finishes
+        metrics.observe('bot_command_seconds', time.perf_counter() - ctx.started,
+                        bot=self.common['name'], command=ctx.command.qualified_name,
+                        status='failed' if ctx.command_failed else 'ok')
+
+    async def start(self, *args, **kwargs):
+        if self.config.get('metrics_port'):
+            await metrics.serve(self.config.get('metrics_host', '127.0.0.1'), self.config['metrics_port'])
+        await super().start(*args, **kwargs)
+
+    async def paginate(self, ctx, pages, timeout=120):
+        """Sends the first embed and flips through the rest with reactions."""
+        message = await ctx.channel.send(embed=pages[0])
+        if len(pages) < 2:
+            return message
+
+        arrows = ['◀', '▶']
+        for arrow in arrows:
+            await message.add_reaction(arrow)
+
+        def check(reaction, user):
+            return reaction.message.id == message.id and user == ctx.author and str(reaction.emoji) in arrows
+
+        page = 0
+        while True:
+            try:
+                (reaction, user) = await self.wait_for('reaction_add', check=check, timeout=timeout)
+            except asyncio.TimeoutError:
+                return message
+
+            page = (page + (1 if str(reaction.emoji) == '▶' else -1)) % len(pages)
+            await message.edit(embed=pages[page])
+            try:
+                await message.remove_reaction(reaction.emoji, user)
+            except discord.errors.HTTPException:
+                pass  # no manage messages permission, or a DM
+
+    async def close(self):
+        await super().close()
+        self.chain.release()
+        if self.price_bus:
+            self.price_bus.release()
+
+    def load_cogs(self):
         for cog in self.commands:
             try:
                 if self.common.get('command_override'):
@@ -177,4 +357,10 @@ class Bot(commands.Bot):
             except Exception as e:
                 print(f'Failed to load extension {cog}.', e)
 
+    async def launch(self):
+        self.load_cogs()
+        await self.start(self.common['apikey'])
+
+    def exec(self):
+        self.load_cogs()
         self.run(self.common['apikey'])
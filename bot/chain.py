@@ -0,0 +1,176 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from web3 import Web3
+from web3.middleware import geth_poa_middleware
+
+from bot.constants import ConstantsCache
+from bot.heads import HeadSubscription
+from bot.metrics import metrics, rpc_middleware
+from bot.multicall import Multicall
+from bot.pool import PoolProvider, make_provider
+from bot.reserves import ReserveTracker
+from bot.scheduler import Scheduler
+from bot.snapshot import SnapshotCache
+
+
+class Chain:
+    """Blocking web3 access, run on a bounded thread pool so slow RPCs never
+    stall the event loop."""
+    instances = {}
+
+    def __init__(self, config):
+        nodes = self.nodes(config)
+        if not nodes:
+            raise Exception("Required setting 'bsc_node' not configured!")
+
+        self.node = nodes
+        self.timeout = config.get('rpc_timeout', 10)
+
+        if len(nodes) > 1:
+            provider = PoolProvider(nodes, self.timeout, config.get('rpc_hedge_after'))
+        else:
+            provider = make_provider(nodes[0], self.timeout)
+
+        self.web3 = Web3(provider)  # type: Web3.eth.account
+        self.web3.middleware_onion.inject(geth_poa_middleware, layer=0)
+        self.web3.middleware_onion.add(rpc_middleware, 'metrics')
+
+        # one RPC budget for every loop on these nodes
+        self.scheduler = Scheduler(config.get('rpc_budget'))
+        self.web3.middleware_onion.add(self.scheduler.middleware, 'budget')
+
+        self.multicall = Multicall(self.web3, config.get('multicall'))
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.get('rpc_workers', 4), thread_name_prefix='rpc')
+
+        self.clients = 0
+        self.inflight = {}  # flight key -> future, see run()
+        self.snapshots = SnapshotCache(config.get('snapshot_max_age', 3))
+        self.constants = ConstantsCache(
+            config.get('constants_file', 'constants.json'), config.get('chain_id', 56))
+        self.heads = HeadSubscription(config['bsc_ws'], self.snapshots.advance) \
+            if config.get('bsc_ws') else None
+        self.reserves = ReserveTracker(
+            self, config.get('reorg_depth', 15), config.get('log_chunk_size', 5000)) \
+            if config.get('track_reserves', True) else None
+
+    @staticmethod
+    def nodes(config):
+        # bsc_node is one endpoint or a list of them
+        node = config.get('bsc_node')
+        return tuple(node) if isinstance(node, (list, tuple)) else (node,) if node else ()
+
+    @classmethod
+    def shared(cls, config):
+        # bots in the same process talking to the same nodes share one chain
+        node = cls.nodes(config)
+        if node not in cls.instances:
+            cls.instances[node] = cls(config)
+
+        chain = cls.instances[node]
+        chain.clients += 1
+        return chain
+
+    def read(self, calls, block_identifier='latest', max_age=None):
+        """Reads contract functions, taking whatever the snapshot cache already
+        holds and fetching the rest in one multicall."""
+        keys = None
+        if isinstance(calls, dict):
+            keys, calls = list(calls.keys()), list(calls.values())
+
+        requests = [Multicall.encode(fn) for fn in calls]
+        pinned = block_identifier if isinstance(block_identifier, int) else None
+        (block_number, cached) = self.snapshots.get(
+            requests, max_age, pinned)
+
+        missing = {request: fn for request, fn in zip(requests, calls)
+                   if request not in cached}
+        for request, fn in zip(requests, calls):
+            metrics.inc('bot_contract_reads_total', contract=fn.address, function=fn.fn_name,
+                        source='rpc' if request in missing else 'cache')
+
+        if missing:
+            # the rest comes from the block the hits did, so the read is one block
+            if cached and pinned is None:
+                block_identifier = block_number
+            (block_number, results) = self.multicall.aggregate(
+                list(missing), block_identifier)
+            fetched = {request: self.multicall.decode(fn, success, data)
+                       for (request, fn), (success, data) in zip(missing.items(), results)}
+            self.snapshots.store(block_number, fetched)
+            cached.update(fetched)
+
+        values = [cached[request] for request in requests]
+        if keys is not None:
+            values = dict(zip(keys, values))
+
+        return (block_number, values)
+
+    def read_constants(self, reads):
+        return self.constants.get(self, reads)
+
+    @staticmethod
+    def task_name(fn):
+        # a contract function's .call is labelled by the contract function
+        owner = getattr(fn, '__self__', None)
+        if hasattr(owner, 'fn_name'):
+            return owner.fn_name
+        return getattr(fn, '__qualname__', type(fn).__name__)
+
+    @staticmethod
+    def flight_key(fn, args, kwargs):
+        """What makes two calls identical, or None if they can't be told apart."""
+        owner = getattr(fn, '__self__', None)
+        if hasattr(owner, 'fn_name'):
+            # every balanceOf(address) builds a new ContractFunction, so compare what it reads
+            key = (owner.address, owner.fn_name, tuple(owner.args), args, tuple(sorted(kwargs.items())))
+        else:
+            key = (fn, args, tuple(sorted(kwargs.items())))
+
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    async def execute(self, fn, args, kwargs, timeout):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        future = loop.run_in_executor(
+            self.executor, partial(fn, *args, **kwargs))
+        try:
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        finally:
+            metrics.observe('bot_rpc_task_seconds', time.perf_counter() - start,
+                            task=self.task_name(fn))
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        """Runs blocking chain work on the pool. Callers asking for the same
+        work while it is in flight share its result."""
+        key = self.flight_key(fn, args, kwargs)
+        if key is None:
+            return await self.execute(fn, args, kwargs, timeout)
+
+        if key in self.inflight:
+            metrics.inc('bot_rpc_coalesced_total', task=self.task_name(fn))
+        else:
+            self.inflight[key] = asyncio.ensure_future(
+                self.execute(fn, args, kwargs, timeout))
+            self.inflight[key].add_done_callback(
+                lambda _: self.inflight.pop(key, None))
+
+        # one caller giving up mustn't cancel the others
+        return await asyncio.shield(self.inflight[key])
+
+    def release(self):
+        self.clients -= 1
+        if self.clients <= 0:
+            self.executor.shutdown(wait=False)
+            if isinstance(self.web3.provider, PoolProvider):
+                self.web3.provider.close()
+            if self.heads:
+                self.heads.close()
+            self.instances.pop(self.node, None)
@@ -45,5 +45,14 @@ class Owner(commands.Cog):
         else:
             await ctx.message.add_reaction('👍')
 
+    @commands.command(name='cache', hidden=True)
+    @commands.is_owner()
+    async def owner_cache_stats(self, ctx):
+        """Command which shows the chain snapshot cache counters."""
+
+        stats = self.bot.chain.snapshots.stats()
+        await ctx.send(f"Block {stats['block_number']}: {stats['hits']} hits, "
+                       f"{stats['misses']} misses ({stats['hit_rate']:.1%})")
+
 def setup(bot):
     bot.add_cog(Owner(bot))
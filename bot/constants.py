@@ -0,0 +1,39 @@
+import json
+import os
+import threading
+
+
+class ConstantsCache:
+    """Values that never change once a contract is deployed (decimals, periods,
+    reward schedules), saved to disk by chain id and address so restarts
+    don't have to read them again."""
+
+    def __init__(self, filename='constants.json', chain_id=56):
+        self.filename = filename
+        self.chain_id = chain_id
+        self.lock = threading.Lock()
+        self.values = {}
+
+        if os.path.exists(filename):
+            with open(filename, 'r') as constants_file:
+                self.values = json.load(constants_file)
+
+    def key(self, fn):
+        return f"{self.chain_id}:{fn.address}:{fn.fn_name}{list(fn.args)}"
+
+    def get(self, chain, reads):
+        """Returns each read's value from disk, fetching any missing ones from
+        the chain in one batch."""
+        keys = {name: self.key(fn) for name, fn in reads.items()}
+        missing = {name: fn for name, fn in reads.items()
+                   if keys[name] not in self.values}
+
+        if missing:
+            (_, fetched) = chain.read(missing)
+            with self.lock:
+                self.values.update(
+                    {keys[name]: value for name, value in fetched.items()})
+                with open(self.filename, 'w') as constants_file:
+                    json.dump(self.values, constants_file, indent=1)
+
+        return {name: self.values[key] for name, key in keys.items()}
@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+from discord.ext import commands
+
+from bot.metrics import metrics
+
+
+class CommandQueueFull(commands.CheckFailure):
+    pass
+
+
+class CommandQueue:
+    """Spaces out commands per user and per channel.
+
+    Instead of rejecting a command on cooldown, it waits for its turn, so a
+    burst is answered at a steady pace. Commands that would wait longer than
+    `max_wait` are dropped, which keeps every response within that bound."""
+
+    def __init__(self, user_rate=2, channel_rate=0.5, max_wait=10):
+        self.rates = {'user': user_rate, 'channel': channel_rate}
+        self.max_wait = max_wait
+        self.next_start = {}  # (kind, id) -> when the next command may start
+
+    async def wait(self, ctx):
+        now = time.monotonic()
+        keys = [('user', ctx.author.id), ('channel', ctx.channel.id)]
+        start = max([now] + [self.next_start.get(key, 0) for key in keys])
+
+        if start - now > self.max_wait:
+            metrics.inc('bot_commands_queued_total', outcome='dropped')
+            raise CommandQueueFull(f"{ctx.author} is sending commands too quickly")
+
+        for key in keys:
+            self.next_start[key] = start + self.rates[key[0]]
+
+        if len(self.next_start) > 10000:
+            self.next_start = {key: next_start for key, next_start in self.next_start.items()
+                               if next_start > now}
+
+        if start > now:
+            metrics.inc('bot_commands_queued_total', outcome='delayed')
+            await asyncio.sleep(start - now)
@@ -0,0 +1,25 @@
+from decimal import Decimal
+
+# a uint256 has at most 78 digits, so no token amount needs a larger exponent
+MAX_EXPONENT = 78
+POW10 = tuple(10 ** n for n in range(MAX_EXPONENT + 1))
+DECIMAL_POW10 = {n: Decimal(10) ** n
+                 for n in range(-MAX_EXPONENT, MAX_EXPONENT + 1)}
+
+
+def scale(n):
+    return DECIMAL_POW10.get(n) or Decimal(10) ** n
+
+
+def to_decimal(raw, decimals):
+    """A raw on-chain integer as a Decimal amount of tokens."""
+    return Decimal(raw) * scale(-decimals)
+
+
+def ratio(numerator, numerator_decimals, denominator, denominator_decimals):
+    """The ratio of two raw on-chain amounts, e.g. a price from LP reserves.
+
+    Divides the integers once and shifts the result, which gives the same
+    Decimal as dividing the two shifted amounts. The unary plus rounds each
+    amount to the context precision first, as shifting them would."""
+    return +Decimal(numerator) / +Decimal(denominator) * scale(denominator_decimals - numerator_decimals)
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlparse
+
+import websockets
+
+
+class Listener:
+    """Runs a coroutine when new blocks arrive, at most once per `debounce`
+    seconds and never twice at the same time. Blocks arriving mid-run are
+    folded into one more run."""
+
+    def __init__(self, callback, debounce=1):
+        self.callback = callback
+        self.debounce = debounce
+        self.pending = False
+        self.last_run = 0
+        self.task = None
+
+    def trigger(self):
+        self.pending = True
+        if not self.task:
+            self.task = asyncio.ensure_future(self.run())
+
+    async def run(self):
+        try:
+            while self.pending:
+                wait = self.last_run + self.debounce - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                self.pending = False
+                self.last_run = time.monotonic()
+                try:
+                    await self.callback()
+                except Exception as e:
+                    print(f"New block update {self.callback.__qualname__} failed:", e)
+        finally:
+            self.task = None
+
+
+class HeadSubscription:
+    """Follows new blocks through an eth_subscribe('newHeads') WebSocket,
+    reconnecting with a backoff whenever it drops."""
+
+    def __init__(self, url, on_head=None, reconnect_delay=1, max_reconnect_delay=60):
+        self.url = url
+        self.name = urlparse(url).hostname
+        self.on_head = on_head
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.listeners = []
+        self.block_number = None
+        self.last_head = 0
+        self.task = None
+
+    def subscribe(self, callback, debounce=1):
+        self.listeners.append(Listener(callback, debounce))
+        if not self.task:
+            self.task = asyncio.ensure_future(self.run())
+
+    def fresh(self, max_age):
+        return time.monotonic() - self.last_head < max_age
+
+    def new_head(self, block_number):
+        # an older head is a node behind its peers; the same height is a reorg
+        if self.block_number is not None and block_number < self.block_number:
+            return
+
+        self.block_number = block_number
+        self.last_head = time.monotonic()
+        if self.on_head:
+            self.on_head(block_number)
+        for listener in self.listeners:
+            listener.trigger()
+
+    async def run(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                async with websockets.connect(self.url, close_timeout=1) as socket:
+                    await socket.send(json.dumps({
+                        'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe', 'params': ['newHeads']}))
+                    reply = json.loads(await socket.recv())
+                    if 'error' in reply:
+                        raise Exception(f"newHeads subscription refused: {reply['error']}")
+
+                    print(f"Following new blocks from {self.name}")
+                    delay = self.reconnect_delay
+                    async for message in socket:
+                        head = json.loads(message).get('params', {}).get('result', {})
+                        if 'number' in head:
+                            self.new_head(int(head['number'], 16))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Block subscription to {self.name} dropped, polling until it is back.", e)
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
@@ -0,0 +1,194 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+# seconds, from a cached read up to a timed out RPC
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Metrics:
+    """Counters, gauges and latency histograms for every bot in the process,
+    served in the Prometheus text format."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.described = {}  # name -> (type, help)
+        self.values = {}  # (name, labels) -> number, or bucket counts + [sum, count]
+        self.runner = None
+
+    def describe(self, name, kind, help_text):
+        self.described[name] = (kind, help_text)
+
+    @staticmethod
+    def labels(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = (name, self.labels(labels))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, self.labels(labels))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, self.labels(labels))
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [0] * len(self.buckets) + [0, 0]
+            histogram = self.values[key]
+            # anything past the last bucket only shows up in +Inf, i.e. the count
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def loop(self, name, interval, coro, **labels):
+        """Wraps a tasks.loop coroutine to record how long each tick takes and
+        how late it started. `interval` may be a function, for loops whose
+        interval changes."""
+        last_start = None
+
+        async def tick(*args, **kwargs):
+            nonlocal last_start
+            start = time.monotonic()
+            if last_start is not None:
+                expected = interval() if callable(interval) else interval
+                self.observe('bot_loop_drift_seconds', max(0, start - last_start - expected),
+                             loop=name, **labels)
+            last_start = start
+
+            try:
+                return await coro(*args, **kwargs)
+            finally:
+                self.observe('bot_loop_tick_seconds', time.monotonic() - start,
+                             loop=name, **labels)
+
+        return tick
+
+    @staticmethod
+    def format_labels(labels, extra=()):
+        labels = labels + extra
+        if not labels:
+            return ''
+        escaped = (f'{key}="' + value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') + '"'
+                   for key, value in labels)
+        return '{' + ','.join(escaped) + '}'
+
+    def render(self):
+        with self.lock:
+            values = sorted((key, list(value) if isinstance(value, list) else value)
+                            for key, value in self.values.items())
+
+        lines = []
+        current = None
+        for (name, labels), value in values:
+            if name != current:
+                current = name
+                (kind, help_text) = self.described.get(
+                    name, ('histogram' if isinstance(value, list) else 'untyped', ''))
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+            if not isinstance(value, list):
+                lines.append(f"{name}{self.format_labels(labels)} {value}")
+                continue
+
+            cumulative = 0
+            for bound, count in zip(self.buckets, value):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{self.format_labels(labels, (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{self.format_labels(labels, (('le', '+Inf'),))} {value[-1]}")
+            lines.append(f"{name}_sum{self.format_labels(labels)} {value[-2]}")
+            lines.append(f"{name}_count{self.format_labels(labels)} {value[-1]}")
+
+        return '\n'.join(lines) + '\n'
+
+    async def handle(self, request):
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def serve(self, host='127.0.0.1', port=9100):
+        # one endpoint per process, however many bots call this
+        if self.runner:
+            return
+
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+
+
+metrics = Metrics()
+metrics.describe('bot_rpc_request_seconds', 'histogram',
+                 'JSON-RPC request latency by method')
+metrics.describe('bot_rpc_errors_total', 'counter',
+                 'JSON-RPC requests that raised or returned an error')
+metrics.describe('bot_rpc_endpoint_latency_seconds', 'gauge',
+                 'Moving average latency of each pooled node')
+metrics.describe('bot_rpc_endpoint_failures_total', 'counter',
+                 'Requests a pooled node failed or refused')
+metrics.describe('bot_rpc_failovers_total', 'counter',
+                 'Requests retried on another node after a failure')
+metrics.describe('bot_rpc_hedges_total', 'counter',
+                 'Slow reads also sent to a second node')
+metrics.describe('bot_rpc_coalesced_total', 'counter',
+                 'Chain work that joined an identical request already in flight')
+metrics.describe('bot_commands_queued_total', 'counter',
+                 'Commands delayed or dropped by the per-user and per-channel cooldowns')
+metrics.describe('bot_contract_reads_total', 'counter',
+                 'Contract function reads, from the node or the snapshot cache')
+metrics.describe('bot_rpc_task_seconds', 'histogram',
+                 'Time from queueing blocking chain work to its result, by task')
+metrics.describe('bot_skipped_ticks_total', 'counter',
+                 'Loop ticks skipped because the chain could not be read')
+metrics.describe('bot_loop_tick_seconds', 'histogram', 'Duration of each loop tick')
+metrics.describe('bot_loop_drift_seconds', 'histogram',
+                 'How late each loop tick started after its interval')
+metrics.describe('bot_discord_edit_seconds', 'histogram',
+                 'Latency of nickname and presence edits')
+metrics.describe('bot_command_seconds', 'histogram', 'Command handling time')
+metrics.describe('bot_events_catchup_blocks', 'gauge',
+                 'Blocks scanned by the latest events tick')
+metrics.describe('bot_price_bus_reads_total', 'counter',
+                 'Price bus lookups, by whether a fresh snapshot was found')
+metrics.describe('bot_loop_interval_seconds', 'gauge', 'Current interval of each scheduled loop')
+metrics.describe('bot_rpc_budget_stretch', 'gauge',
+                 'How much loop intervals are stretched to stay within rpc_budget')
+
+
+def rpc_middleware(make_request, web3):
+    def middleware(method, params):
+        start = time.perf_counter()
+        try:
+            response = make_request(method, params)
+        except Exception:
+            metrics.inc('bot_rpc_errors_total', method=method)
+            raise
+        finally:
+            metrics.observe('bot_rpc_request_seconds',
+                            time.perf_counter() - start, method=method)
+
+        if 'error' in response:
+            metrics.inc('bot_rpc_errors_total', method=method)
+        return response
+
+    return middleware
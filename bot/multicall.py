@@ -0,0 +1,86 @@
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+
+# Multicall3 is deployed at the same address on BSC and most other EVM chains
+MULTICALL_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+
+MULTICALL_ABI = [{
+    'name': 'tryBlockAndAggregate',
+    'type': 'function',
+    'stateMutability': 'payable',
+    'inputs': [
+        {'name': 'requireSuccess', 'type': 'bool'},
+        {'name': 'calls', 'type': 'tuple[]', 'components': [
+            {'name': 'target', 'type': 'address'},
+            {'name': 'callData', 'type': 'bytes'}
+        ]}
+    ],
+    'outputs': [
+        {'name': 'blockNumber', 'type': 'uint256'},
+        {'name': 'blockHash', 'type': 'bytes32'},
+        {'name': 'returnData', 'type': 'tuple[]', 'components': [
+            {'name': 'success', 'type': 'bool'},
+            {'name': 'returnData', 'type': 'bytes'}
+        ]}
+    ]
+}]
+
+
+class Multicall:
+    def __init__(self, web3, address=None):
+        self.web3 = web3
+        self.contract = web3.eth.contract(
+            address=address or MULTICALL_ADDRESS, abi=MULTICALL_ABI)
+
+    def call(self, calls, block_identifier='latest', allow_failure=False):
+        """Executes contract function calls in a single eth_call.
+
+        `calls` is a list or dict of bound contract functions, e.g.
+        `contract.functions.balanceOf(address)`. Returns the block number the
+        calls were executed at, and the decoded results in the same shape.
+        Failed calls decode to None when `allow_failure` is set."""
+        keys = None
+        if isinstance(calls, dict):
+            keys, calls = list(calls.keys()), list(calls.values())
+
+        if not calls:
+            return (None, {} if keys is not None else [])
+
+        (block_number, results) = self.aggregate(
+            [self.encode(fn) for fn in calls], block_identifier, allow_failure)
+
+        values = [self.decode(fn, success, data, allow_failure)
+                  for fn, (success, data) in zip(calls, results)]
+
+        if keys is not None:
+            values = dict(zip(keys, values))
+
+        return (block_number, values)
+
+    def aggregate(self, requests, block_identifier='latest', allow_failure=False):
+        (block_number, _, results) = self.contract.functions.tryBlockAndAggregate(
+            not allow_failure, requests).call(block_identifier=block_identifier)
+        return (block_number, results)
+
+    @staticmethod
+    def encode(fn):
+        return (fn.address, fn._encode_transaction_data())
+
+    def decode(self, fn, success, data, allow_failure=False):
+        output_types = get_abi_output_types(fn.abi)
+        if success and output_types and not data:
+            # e.g. a contract whose fallback function accepted a call it doesn't have
+            if not allow_failure:
+                raise Exception(f"{fn.address} returned no data for {fn.fn_name}")
+            success = False
+        if not success:
+            return None
+
+        decoded = self.web3.codec.decode_abi(output_types, data)
+        normalized = map_abi_data(
+            BASE_RETURN_NORMALIZERS, output_types, decoded)
+
+        # match ContractFunction.call(), which unwraps single return values
+        if len(normalized) == 1:
+            return normalized[0]
+        return normalized
@@ -0,0 +1,125 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+
+class Database:
+    """A SQLite engine whose work runs in batches on one background thread.
+
+    Writes are queued and never wait on disk; reads return futures. The queue
+    is bounded, and whatever is pending is flushed when the last bot using
+    the database closes."""
+    instances = {}
+
+    def __init__(self, url, echo=False, max_pending=1000, batch_size=100):
+        self.url = url
+        self.engine = create_engine(url, echo=echo)
+        if url.startswith('sqlite'):
+            event.listen(self.engine, 'connect', self.configure_sqlite)
+
+        self.session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.batch_size = batch_size
+        self.queue = queue.Queue(max_pending)
+        self.clients = 0
+
+        self.thread = threading.Thread(
+            target=self.worker, name='database', daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def shared(cls, url, echo=False, max_pending=1000):
+        if url not in cls.instances:
+            cls.instances[url] = cls(url, echo, max_pending)
+
+        database = cls.instances[url]
+        database.clients += 1
+        return database
+
+    @staticmethod
+    def configure_sqlite(dbapi_connection, connection_record):
+        # WAL keeps the append-heavy writer from blocking readers
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+    def submit(self, fn):
+        """Queues fn(session) for the next batch without waiting for it."""
+        try:
+            self.queue.put_nowait((fn, None))
+        except queue.Full:
+            print(f"Database queue for {self.url} is full, dropping write")
+
+    def call(self, fn):
+        """Queues fn(session) and returns a future for its (committed) result,
+        failed straight away if the queue is full."""
+        future = Future()
+        try:
+            self.queue.put_nowait((fn, future))
+        except queue.Full:
+            future.set_exception(Exception(f"Database queue for {self.url} is full"))
+        return future
+
+    async def run(self, fn):
+        return await asyncio.wrap_future(self.call(fn))
+
+    def worker(self):
+        session = self.session()
+        running = True
+
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                running = False
+                batch = [item for item in batch if item is not None]
+
+            results = self.apply(session, batch)
+            try:
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                print('Database commit failed:', e)
+                results = [(future, e, True) for future, _, _ in results]
+
+            for future, result, failed in results:
+                if future is None:
+                    continue
+                if failed:
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+        session.close()
+
+    def apply(self, session, batch):
+        results = []
+        for i, (fn, future) in enumerate(batch):
+            try:
+                result = fn(session)
+                session.flush()
+                results.append((future, result, False))
+            except Exception as e:
+                session.rollback()
+                print('Database write failed:', e)
+
+                # the rollback discarded the whole batch so far, so redo it without this one
+                return [(future, e, True)] + self.apply(session, batch[:i] + batch[i + 1:])
+
+        return results
+
+    def release(self, timeout=10):
+        self.clients -= 1
+        if self.clients <= 0:
+            self.queue.put(None)
+            self.thread.join(timeout)
+            self.instances.pop(self.url, None)
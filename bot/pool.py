@@ -0,0 +1,175 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+from bot.metrics import metrics
+
+# requests that only read, so sending one twice is harmless
+HEDGEABLE = {'eth_call', 'eth_getLogs', 'eth_blockNumber', 'eth_getBlockByNumber',
+             'eth_getBalance', 'eth_chainId', 'net_version'}
+# node-side errors (overloaded, rate limited, out of sync) another node may not have
+RETRYABLE_ERRORS = {-32000, -32005, -32603}
+
+
+def retryable(response):
+    error = response.get('error')
+    return isinstance(error, dict) and error.get('code') in RETRYABLE_ERRORS and \
+        'revert' not in str(error.get('message', ''))
+
+
+def make_provider(node, timeout):
+    url = urlparse(node)
+    if 'http' in url.scheme:
+        # web3 keeps one keep-alive session per endpoint
+        return Web3.HTTPProvider(node, request_kwargs={'timeout': timeout})
+    return Web3.IPCProvider(url.path, timeout=timeout)
+
+
+class Endpoint:
+    def __init__(self, node, provider):
+        self.node = node
+        self.name = urlparse(node).hostname or urlparse(node).path  # no API keys in labels
+        self.provider = provider
+        self.latency = None  # moving average, seconds
+        self.failures = 0
+        self.down_until = 0
+
+    def healthy(self, now):
+        return self.down_until <= now
+
+    def succeeded(self, latency, smoothing):
+        self.failures = 0
+        self.down_until = 0
+        self.measured(latency, smoothing)
+
+    def measured(self, latency, smoothing):
+        self.latency = latency if self.latency is None else \
+            smoothing * latency + (1 - smoothing) * self.latency
+        metrics.set('bot_rpc_endpoint_latency_seconds', self.latency, endpoint=self.name)
+
+    def lagging(self, elapsed, smoothing):
+        # still unanswered after a hedge won, so it is at least this slow
+        if self.latency is None or elapsed > self.latency:
+            self.measured(elapsed, smoothing)
+
+    def failed(self, max_backoff):
+        # back off exponentially, the pool retries it once the time is up
+        self.failures += 1
+        self.down_until = time.monotonic() + min(2 ** self.failures, max_backoff)
+        metrics.inc('bot_rpc_endpoint_failures_total', endpoint=self.name)
+
+
+class PoolProvider(BaseProvider):
+    """Sends each request to the fastest healthy node, failing over to the
+    next one when a node errors or times out.
+
+    With hedge_after set, a read still unanswered after that many seconds is
+    also sent to the next fastest node and whichever answers first wins."""
+
+    def __init__(self, nodes, timeout=10, hedge_after=None, smoothing=0.3, max_backoff=60):
+        self.endpoints = [Endpoint(node, make_provider(node, timeout))
+                          for node in nodes]
+        self.hedge_after = hedge_after
+        self.smoothing = smoothing
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=2 * len(self.endpoints), thread_name_prefix='rpc-hedge') if hedge_after else None
+
+    def ranked(self):
+        # untried nodes first, so every node gets measured
+        now = time.monotonic()
+        with self.lock:
+            healthy = sorted((endpoint for endpoint in self.endpoints if endpoint.healthy(now)),
+                             key=lambda endpoint: endpoint.latency or 0)
+            down = sorted((endpoint for endpoint in self.endpoints if not endpoint.healthy(now)),
+                          key=lambda endpoint: endpoint.down_until)
+        return healthy + down
+
+    def send(self, endpoint, method, params):
+        """Returns (response, ok), raising only if the node can't be reached."""
+        start = time.perf_counter()
+        try:
+            response = endpoint.provider.make_request(method, params)
+        except Exception:
+            with self.lock:
+                endpoint.failed(self.max_backoff)
+            raise
+
+        ok = not retryable(response)
+        with self.lock:
+            if ok:
+                endpoint.succeeded(time.perf_counter() - start, self.smoothing)
+            else:
+                endpoint.failed(self.max_backoff)
+        return (response, ok)
+
+    def make_request(self, method, params):
+        endpoints = self.ranked()
+        if self.hedge_after and method in HEDGEABLE and len(endpoints) > 1:
+            return self.hedged(endpoints, method, params)
+
+        for i, endpoint in enumerate(endpoints):
+            last = i == len(endpoints) - 1
+            try:
+                (response, ok) = self.send(endpoint, method, params)
+                if ok or last:
+                    return response
+                error = response['error']
+            except Exception as e:
+                if last:
+                    raise
+                error = e
+
+            print(f"RPC node {endpoint.name} failed, trying the next one.", error)
+            metrics.inc('bot_rpc_failovers_total', method=method)
+
+    def hedged(self, endpoints, method, params):
+        remaining = list(endpoints)
+        sent = {}  # future -> (endpoint, when it was sent)
+
+        def submit():
+            endpoint = remaining.pop(0)
+            future = self.executor.submit(self.send, endpoint, method, params)
+            sent[future] = (endpoint, time.perf_counter())
+            return future
+
+        pending = {submit()}
+        (response, error) = (None, None)
+
+        while pending:
+            # a hedge goes out after hedge_after, a failover as soon as a node fails
+            (done, pending) = wait(
+                pending, timeout=self.hedge_after if remaining else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                elif future.result()[1]:
+                    # rank the nodes still working on it below the winner right away
+                    with self.lock:
+                        for (endpoint, started) in map(sent.get, pending):
+                            endpoint.lagging(time.perf_counter() - started, self.smoothing)
+                    return future.result()[0]
+                else:
+                    response = future.result()[0]
+
+            if remaining and (done or len(pending) < 2):
+                metrics.inc('bot_rpc_failovers_total' if done else 'bot_rpc_hedges_total',
+                            method=method)
+                pending.add(submit())
+
+        # every node failed, an error response is more useful than a dropped connection
+        if response is not None:
+            return response
+        raise error
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False)
+
+    def isConnected(self):
+        return any(endpoint.provider.isConnected() for endpoint in self.endpoints)
@@ -0,0 +1,195 @@
+import asyncio
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b'PBUS'
+VERSION = 1
+HEADER = struct.Struct('<4sII')  # magic, version, slot count
+
+# the values get_prices needs for one token, as unsigned 256 bit integers
+FIELDS = ('quote_reserve', 'token_reserve', 'bnb_reserve', 'busd_reserve', 'lp_supply', 'token_supply')
+# sequence (odd while being written), token and BNB LP addresses, block, unix time,
+# bitmask of FIELDS present
+SLOT_HEADER = struct.Struct('<I40sQdI')
+SLOT_SIZE = 256
+assert SLOT_HEADER.size + 32 * len(FIELDS) <= SLOT_SIZE
+
+
+class PriceBus:
+    """Per-block price inputs shared between processes through a memory-mapped
+    file.
+
+    One fetcher process writes a fixed-size slot per pair of LPs; any number of
+    bot processes read them without touching the node. Each slot has a
+    sequence number that is odd while it is being written, so readers retry
+    instead of seeing half of an update."""
+    instances = {}
+
+    def __init__(self, filename, writer=False, slots=64):
+        self.filename = filename
+        self.writer = writer
+        self.slots = slots
+        self.map = None
+        self.index = {}  # slot key -> slot number
+        self.clients = 0
+        self.lock = threading.Lock()
+
+        if writer:
+            self.open()
+
+    @classmethod
+    def shared(cls, filename, writer=False, slots=64):
+        key = (filename, writer)
+        if key not in cls.instances:
+            cls.instances[key] = cls(filename, writer, slots)
+
+        bus = cls.instances[key]
+        bus.clients += 1
+        return bus
+
+    def open(self):
+        size = HEADER.size + self.slots * SLOT_SIZE
+        if self.writer:
+            # never shrink it: readers may still have the old size mapped
+            with open(self.filename, 'a+b') as bus_file:
+                if os.fstat(bus_file.fileno()).st_size < size:
+                    bus_file.truncate(size)
+            fd = os.open(self.filename, os.O_RDWR)
+            self.map = mmap.mmap(fd, size)
+            os.close(fd)
+            HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.slots)
+            return True
+
+        if not os.path.exists(self.filename):
+            return False
+
+        fd = os.open(self.filename, os.O_RDONLY)
+        try:
+            bus_map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+        (magic, version, slots) = HEADER.unpack_from(bus_map, 0)
+        if magic != MAGIC or version != VERSION:
+            bus_map.close()
+            raise Exception(f"{self.filename} is not a version {VERSION} price bus")
+        if HEADER.size + slots * SLOT_SIZE > len(bus_map):
+            bus_map.close()
+            return False  # the fetcher is still growing it
+
+        (self.map, self.slots) = (bus_map, slots)
+        return True
+
+    def reopen(self):
+        self.close()
+        self.index = {}
+        return self.open()
+
+    @staticmethod
+    def offset(slot):
+        return HEADER.size + slot * SLOT_SIZE
+
+    @staticmethod
+    def key(native_lp, bnb_lp):
+        return bytes.fromhex(native_lp[2:]) + bytes.fromhex(bnb_lp[2:])
+
+    def find(self, key):
+        if key in self.index:
+            return self.index[key]
+
+        for slot in range(self.slots):
+            (_, slot_key, _, _, _) = SLOT_HEADER.unpack_from(self.map, self.offset(slot))
+            if slot_key == key or (self.writer and slot_key == bytes(40)):
+                self.index[key] = slot
+                return slot
+        return None
+
+    def write(self, native_lp, bnb_lp, block_number, values):
+        key = self.key(native_lp, bnb_lp)
+        with self.lock:
+            slot = self.find(key)
+            if slot is None:
+                raise Exception(f"Price bus {self.filename} has no free slot for {native_lp}")
+
+            offset = self.offset(slot)
+            (sequence, _, _, _, _) = SLOT_HEADER.unpack_from(self.map, offset)
+            struct.pack_into('<I', self.map, offset, sequence + 1)
+
+            mask = 0
+            for i, field in enumerate(FIELDS):
+                value = values.get(field)
+                if value is not None:
+                    mask |= 1 << i
+                self.map[offset + SLOT_HEADER.size + 32 * i:offset + SLOT_HEADER.size + 32 * (i + 1)] = \
+                    (value or 0).to_bytes(32, 'big')
+
+            SLOT_HEADER.pack_into(self.map, offset, sequence + 2, key, block_number, time.time(), mask)
+
+    def read(self, native_lp, bnb_lp, max_age=10):
+        """Returns (block number, values) for the LPs, or None if the fetcher
+        hasn't written them in the last `max_age` seconds."""
+        if self.map is None and not self.open():
+            return None
+        if HEADER.unpack_from(self.map, 0)[2] != self.slots and not self.reopen():
+            return None  # the fetcher restarted with another slot count
+
+        wanted = self.key(native_lp, bnb_lp)
+        slot = self.find(wanted)
+        if slot is None:
+            return None
+
+        offset = self.offset(slot)
+        for _ in range(100):
+            data = self.map[offset:offset + SLOT_SIZE]
+            (sequence, key, block_number, updated, mask) = SLOT_HEADER.unpack_from(data)
+            if sequence % 2 == 0 and struct.unpack_from('<I', self.map, offset)[0] == sequence:
+                break
+        else:
+            return None
+
+        if key != wanted:
+            # the fetcher restarted with a new layout
+            self.index.pop(wanted, None)
+            return None
+        if time.time() - updated > max_age:
+            # the fetcher may have recreated the file, so map it afresh
+            self.reopen()
+            return None
+
+        values = {}
+        for i, field in enumerate(FIELDS):
+            if mask & (1 << i):
+                start = SLOT_HEADER.size + 32 * i
+                values[field] = int.from_bytes(data[start:start + 32], 'big')
+        return (block_number, values)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def release(self):
+        self.clients -= 1
+        if self.clients <= 0:
+            self.close()
+            self.instances.pop((self.filename, self.writer), None)
+
+
+async def run_fetcher(bots, interval=3):
+    """Refreshes every bot's prices, and so the bus, on each new block (with
+    bsc_ws) or every `interval` seconds."""
+
+    async def tick():
+        results = await asyncio.gather(*(bot.run_rpc(bot.get_token_price) for bot in bots),
+                                       return_exceptions=True)
+        for bot, result in zip(bots, results):
+            if isinstance(result, Exception):
+                print(f"Fetching {bot.common['name']} failed:", repr(result))
+
+    poll = bots[0].follow_blocks(tick, interval)
+    while True:
+        await poll()
+        await asyncio.sleep(interval)
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import discord
+
+from bot.metrics import metrics
+
+
+class Publisher:
+    """Pushes nickname and presence changes to Discord.
+
+    Values already shown are skipped, edits fan out over guilds with bounded
+    concurrency and a minimum interval per guild, and an edit still waiting
+    for its turn is replaced by any newer value."""
+
+    def __init__(self, bot, concurrency=4, nick_interval=1, presence_interval=5):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.nick_interval = nick_interval
+        self.presence_interval = presence_interval
+        self.semaphore = None
+
+        self.nickname = None
+        self.presence = None
+        self.shown = {}  # guild id (or 'presence') -> value Discord has
+        self.pending = {}  # guild id (or 'presence') -> latest wanted value
+        self.last_edit = {}
+        self.workers = {}
+
+    def publish_nickname(self, nickname):
+        self.nickname = nickname
+        for guild in self.bot.guilds:
+            self.publish_guild(guild)
+
+    def publish_guild(self, guild):
+        if self.nickname is None:
+            return
+
+        self.shown.setdefault(guild.id, guild.me.nick)
+        self.schedule(guild.id, self.nickname, self.nick_interval,
+                      lambda nickname: guild.me.edit(nick=nickname))
+
+    def publish_presence(self, presence):
+        self.presence = presence
+        self.schedule('presence', presence, self.presence_interval,
+                      lambda presence: self.bot.change_presence(activity=discord.Game(name=presence)))
+
+    def schedule(self, key, value, interval, edit):
+        if self.shown.get(key) == value and key not in self.workers:
+            return
+
+        self.pending[key] = value
+        if key not in self.workers:
+            self.workers[key] = asyncio.ensure_future(
+                self.run(key, interval, edit))
+
+    async def run(self, key, interval, edit):
+        if not self.semaphore:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        try:
+            while (value := self.pending.pop(key, None)) is not None:
+                if value == self.shown.get(key):
+                    continue
+
+                # respect the bucket, picking up whatever is newest once it frees
+                wait = self.last_edit.get(key, 0) + interval - time.monotonic()
+                if wait > 0:
+                    self.pending.setdefault(key, value)
+                    await asyncio.sleep(wait)
+                    continue
+
+                async with self.semaphore:
+                    start = time.monotonic()
+                    try:
+                        await edit(value)
+                        self.shown[key] = value
+                    except discord.errors.HTTPException as e:
+                        print(f"Failed to publish {value!r} to {key}:", e)
+                    finally:
+                        self.last_edit[key] = time.monotonic()
+                        metrics.observe('bot_discord_edit_seconds', self.last_edit[key] - start,
+                                        bot=self.bot.common['name'],
+                                        kind='presence' if key == 'presence' else 'nickname')
+        finally:
+            del self.workers[key]
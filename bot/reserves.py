@@ -0,0 +1,164 @@
+import threading
+import time
+
+from eth_utils import event_signature_to_log_topic
+
+from bot.metrics import metrics
+
+PAIR_ABI = [{
+    'name': 'getReserves',
+    'type': 'function',
+    'stateMutability': 'view',
+    'inputs': [],
+    'outputs': [
+        {'name': 'reserve0', 'type': 'uint112'},
+        {'name': 'reserve1', 'type': 'uint112'},
+        {'name': 'blockTimestampLast', 'type': 'uint32'}
+    ]
+}, {
+    'name': 'token0',
+    'type': 'function',
+    'stateMutability': 'view',
+    'inputs': [],
+    'outputs': [{'name': '', 'type': 'address'}]
+}, {
+    'name': 'token1',
+    'type': 'function',
+    'stateMutability': 'view',
+    'inputs': [],
+    'outputs': [{'name': '', 'type': 'address'}]
+}]
+
+SYNC_TOPIC = '0x' + event_signature_to_log_topic('Sync(uint112,uint112)').hex()
+
+
+class Pair:
+    def __init__(self, tokens, block_number, reserves):
+        self.tokens = tokens
+        self.confirmed = (block_number, -1, *reserves)  # latest Sync older than the reorg window
+        self.recent = []  # Syncs inside the window, which may still be reorged away
+
+    @property
+    def reserves(self):
+        (_, _, reserve0, reserve1) = self.recent[-1] if self.recent else self.confirmed
+        return (reserve0, reserve1)
+
+
+class ReserveTracker:
+    """UniswapV2 pair reserves kept up to date from Sync events.
+
+    Pairs are seeded once with getReserves. After that, one eth_getLogs per
+    block covers every tracked pair. Each query re-reads the last
+    `reorg_depth` blocks, so Syncs from blocks that were reorged away are
+    replaced by the canonical ones."""
+
+    def __init__(self, chain, reorg_depth=15, max_range=5000):
+        self.chain = chain
+        self.reorg_depth = reorg_depth
+        self.max_range = max_range
+        self.pairs = {}  # address -> Pair, or None if it isn't a V2 pair
+        self.block_number = None
+        self.updated = 0
+        self.lock = threading.Lock()
+
+    def seed(self, addresses):
+        web3 = self.chain.web3
+        calls = {}
+        for address in addresses:
+            pair = web3.eth.contract(address=address, abi=PAIR_ABI)
+            calls[(address, 'reserves')] = pair.functions.getReserves()
+            calls[(address, 'token0')] = pair.functions.token0()
+            calls[(address, 'token1')] = pair.functions.token1()
+
+        (block_number, values) = self.chain.multicall.call(calls, allow_failure=True)
+        for address in addresses:
+            (reserves, token0, token1) = (values[(address, key)]
+                                          for key in ('reserves', 'token0', 'token1'))
+            if reserves is None or token0 is None or token1 is None:
+                print(f"{address} is not a UniswapV2 pair, reading its balances instead")
+                self.pairs[address] = None
+                continue
+
+            self.pairs[address] = Pair((token0, token1), block_number, reserves[:2])
+
+        if self.block_number is None:
+            self.block_number = block_number
+        return block_number
+
+    def update(self, head):
+        self.updated = time.monotonic()
+        if head <= self.block_number:
+            return
+
+        tracked = {address: pair for address, pair in self.pairs.items() if pair}
+        if not tracked:
+            self.block_number = head
+            return
+
+        from_block = max(self.block_number - self.reorg_depth + 1, 0)
+        if head - from_block >= self.max_range:
+            # after a long outage, starting over is cheaper than catching up
+            self.block_number = self.seed(list(tracked))
+            return
+
+        # straight to the provider: web3's log formatting costs more than the
+        # request once the window holds a few dozen Syncs
+        self.chain.scheduler.count()
+        with metrics.time('bot_rpc_request_seconds', method='eth_getLogs'):
+            response = self.chain.web3.provider.make_request('eth_getLogs', [{
+                'address': list(tracked), 'topics': [SYNC_TOPIC],
+                'fromBlock': hex(from_block), 'toBlock': hex(head)}])
+        if 'error' in response:
+            raise Exception(f"Reading Sync logs failed: {response['error']}")
+        logs = response['result']
+
+        for pair in tracked.values():
+            pair.recent = [sync for sync in pair.recent if sync[0] < from_block]
+
+        by_address = {address.lower(): pair for address, pair in tracked.items()}
+        for log in logs:
+            pair = by_address.get(log['address'].lower())
+            if pair is None or log.get('removed'):
+                continue
+            data = log['data']
+            pair.recent.append((int(log['blockNumber'], 16), int(log['logIndex'], 16),
+                                int(data[2:66], 16), int(data[66:130], 16)))
+
+        # a Sync deeper than the window won't be reorged, so fold it into the base
+        final = head - self.reorg_depth
+        for pair in tracked.values():
+            pair.recent.sort()
+            while pair.recent and pair.recent[0][0] <= final:
+                pair.confirmed = pair.recent.pop(0)
+
+        self.block_number = head
+
+    def head(self):
+        heads = self.chain.heads
+        if heads and heads.block_number and heads.fresh(self.chain.snapshots.max_age):
+            return heads.block_number
+        if time.monotonic() - self.updated < self.chain.snapshots.max_age:
+            return self.block_number  # still the same block
+        return self.chain.web3.eth.block_number
+
+    def get(self, wanted):
+        """Returns the current reserve of each (pair, token) in `wanted`, or None
+        if one of the pairs can't be tracked. Every caller in the same block
+        shares one log query."""
+        with self.lock:
+            new = [pair for (pair, _) in wanted.values() if pair not in self.pairs]
+            if new:
+                self.seed(list(dict.fromkeys(new)))
+
+            if any(self.pairs[pair] is None for (pair, _) in wanted.values()):
+                return None
+
+            self.update(self.head())
+
+            values = {}
+            for key, (address, token) in wanted.items():
+                pair = self.pairs[address]
+                if token not in pair.tokens:
+                    return None
+                values[key] = pair.reserves[pair.tokens.index(token)]
+            return values
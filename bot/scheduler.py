@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+
+from bot.metrics import metrics
+
+
+class Scheduler:
+    """Paces every scheduled loop on a chain against one RPC budget.
+
+    Requests are counted as they go out. When the last `window` seconds ran
+    over `budget` requests per minute, every loop's interval is stretched by
+    the same factor, up to `max_stretch`; once there is room again, the stretch
+    eases back to 1."""
+
+    def __init__(self, budget=None, window=60, adjust_every=5, max_stretch=10, smoothing=0.2):
+        self.budget = budget
+        self.window = window
+        self.max_stretch = max_stretch
+        self.adjust_every = adjust_every
+        self.smoothing = smoothing
+        self.requests = deque()
+        self.adjusted = 0
+        self.stretch = 1
+        self.block_time = 0  # EWMA of seconds per block
+        self.last_block = None
+        self.lock = threading.Lock()
+
+    def count(self, requests=1):
+        now = time.monotonic()
+        with self.lock:
+            self.requests.extend([now] * requests)
+
+    def middleware(self, make_request, web3):
+        def middleware(method, params):
+            self.count()
+            return make_request(method, params)
+
+        return middleware
+
+    def rate(self):
+        """Requests per minute over the window."""
+        now = time.monotonic()
+        with self.lock:
+            while self.requests and self.requests[0] < now - self.window:
+                self.requests.popleft()
+            count = len(self.requests)
+        return count * 60 / self.window
+
+    def adjust(self):
+        now = time.monotonic()
+        if not self.budget or now - self.adjusted < self.adjust_every:
+            return
+        self.adjusted = now
+
+        # damped, so one burst doesn't swing every loop to its slowest
+        self.stretch = min(max(1, self.stretch * (self.rate() / self.budget) ** 0.5), self.max_stretch)
+        metrics.set('bot_rpc_budget_stretch', self.stretch)
+
+    def observe_block(self, block_number):
+        now = time.monotonic()
+        if block_number is None:
+            return
+
+        if self.last_block is not None and block_number > self.last_block[0]:
+            block_time = (now - self.last_block[1]) / (block_number - self.last_block[0])
+            self.block_time = block_time if not self.block_time else \
+                self.smoothing * block_time + (1 - self.smoothing) * self.block_time
+        if self.last_block is None or block_number > self.last_block[0]:
+            self.last_block = (block_number, now)
+
+    def schedule(self, name, interval, min_interval, max_interval, target_move=0.002, **labels):
+        return Schedule(self, name, interval, min_interval, max_interval, target_move, **labels)
+
+
+class Schedule:
+    """When one loop should tick next.
+
+    The loop ticks about as often as the value it tracks takes to move by
+    `target_move`, treating that value as a random walk: a volatile price is
+    refreshed up to every `min_interval` (and never more than once a block),
+    a quiet one every `max_interval`. Until it has seen the value move, it
+    ticks every `interval`."""
+
+    def __init__(self, scheduler, name, interval, min_interval, max_interval, target_move=0.002, smoothing=0.2,
+                 **labels):
+        self.scheduler = scheduler
+        self.name = name
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.default_interval = min(max(interval, self.min_interval), self.max_interval)
+        self.target_move = target_move
+        self.smoothing = smoothing
+        self.labels = labels
+        self.variance = None  # EWMA of squared relative change per second
+        self.last_value = None
+        self.interval = self.default_interval
+        self.next_run = 0
+        self.run_next = None
+
+    def record(self, value, block_number=None):
+        now = time.monotonic()
+        self.scheduler.observe_block(block_number)
+        if not value:
+            return
+
+        value = float(value)
+        if self.last_value:
+            (last, then) = self.last_value
+            if now > then:
+                variance = ((value - last) / last) ** 2 / (now - then)
+                self.variance = variance if self.variance is None else \
+                    self.smoothing * variance + (1 - self.smoothing) * self.variance
+        self.last_value = (value, now)
+
+    def run_at(self, when):
+        """From inside a tick, sets when (monotonic) the next one runs instead
+        of the interval, for loops that know when there is work to do."""
+        self.run_next = when
+
+    def update(self):
+        if self.variance is None:
+            interval = self.default_interval
+        elif self.variance:
+            interval = self.target_move ** 2 / self.variance
+        else:
+            interval = self.max_interval
+        interval = min(max(interval, self.min_interval, self.scheduler.block_time), self.max_interval)
+
+        self.scheduler.adjust()
+        self.interval = interval * self.scheduler.stretch
+        metrics.set('bot_loop_interval_seconds', self.interval, loop=self.name, **self.labels)
+
+    def wrap(self, coro):
+        """Wraps a loop coroutine to skip the calls that come before it's due."""
+
+        async def tick(*args, **kwargs):
+            start = time.monotonic()
+            if start < self.next_run:
+                return
+
+            self.run_next = None
+            self.next_run = start + self.interval  # overlapping calls skip
+            try:
+                return await coro(*args, **kwargs)
+            finally:
+                self.update()
+                self.next_run = start + self.interval if self.run_next is None else self.run_next
+
+        return tick
@@ -0,0 +1,74 @@
+import threading
+import time
+
+
+class SnapshotCache:
+    """Contract call results grouped by the block they were read at, shared by
+    every bot on a chain."""
+
+    def __init__(self, max_age=3, depth=8):
+        self.max_age = max_age
+        self.depth = depth
+        self.blocks = {}  # block number -> (last seen, {key: value})
+        self.head = None  # newest block announced by the node, if subscribed
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @property
+    def latest(self):
+        return max(self.blocks, default=None)
+
+    def get(self, keys, max_age=None, block_number=None):
+        """Returns a block and the cached values it holds for the keys: the newest
+        block read recently enough with any of them (or `block_number`). Hits
+        all come from that one block, so a read stays consistent."""
+        # a caller asking for an age of its own accepts values from older blocks
+        oldest = (self.head or 0) if max_age is None else 0
+        max_age = self.max_age if max_age is None else max_age
+        now = time.monotonic()
+        found = {}
+        newest = None
+
+        with self.lock:
+            if block_number is not None:
+                blocks = [block_number] if block_number in self.blocks else []
+            else:
+                blocks = sorted(self.blocks, reverse=True)
+
+            for number in blocks:
+                (seen, values) = self.blocks[number]
+                if block_number is None and (now - seen > max_age or number < oldest):
+                    continue
+
+                found = {key: values[key] for key in keys if key in values}
+                if found:
+                    newest = number
+                    break
+
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+
+        return (newest, found)
+
+    def advance(self, block_number):
+        # anything read before this block is out of date, however recent
+        with self.lock:
+            self.head = max(block_number, self.head or 0)
+
+    def store(self, block_number, values):
+        with self.lock:
+            (_, cached) = self.blocks.get(block_number, (None, {}))
+            self.blocks[block_number] = (time.monotonic(), {**cached, **values})
+
+            for number in sorted(self.blocks)[:-self.depth]:
+                del self.blocks[number]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'block_number': self.latest,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0
+        }
@@ -1,28 +1,121 @@
 import json
 import os
-from decimal import Decimal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.request import urlopen, Request
 
+from bot.fixedpoint import scale
 
-def fetch_abi(contract):
-    if not os.path.exists('contracts'):
-        os.mkdir('./contracts')
+ABI_BUNDLE = 'contracts/bundle.json'
+
+# BscScan allows 5 requests a second with an API key, and one every 5 seconds without
+BSCSCAN_RATE = {True: 0.2, False: 5}
+bscscan_lock = threading.Lock()
+bscscan_last_request = 0
+
+abi_cache = {}  # address -> abi
+abi_interned = {}  # canonical json -> abi, so identical ABIs share one object
+abi_bundle_loaded = False
+
+
+def intern_abi(abi):
+    return abi_interned.setdefault(json.dumps(abi, sort_keys=True), abi)
+
+
+def load_abi_bundle(filename=ABI_BUNDLE):
+    global abi_bundle_loaded
+    abi_bundle_loaded = True
+
+    if os.path.exists(filename):
+        with open(filename, 'r') as bundle_file:
+            for contract, abi in json.load(bundle_file).items():
+                abi_cache.setdefault(contract, intern_abi(abi))
+
+
+def write_abi_bundle(filename=ABI_BUNDLE):
+    # everything under contracts/ plus whatever was fetched this run
+    os.makedirs('contracts', exist_ok=True)
+    for abi_filename in os.listdir('contracts'):
+        contract = abi_filename[:-len('.json')]
+        if abi_filename.endswith('.json') and contract.startswith('0x'):
+            fetch_abi(contract)
+
+    with open(filename, 'w') as bundle_file:
+        json.dump(abi_cache, bundle_file)
+
+
+def wait_for_bscscan(api_key=None):
+    global bscscan_last_request
+    with bscscan_lock:
+        wait = bscscan_last_request + BSCSCAN_RATE[bool(api_key)] - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        bscscan_last_request = time.monotonic()
+
+
+def download_abi(contract, timeout=10, retries=3, api_key=None):
+    url = 'https://api.bscscan.com/api?module=contract&action=getabi&address=' + contract
+    if api_key:
+        url += '&apikey=' + api_key
+
+    for attempt in range(retries):
+        wait_for_bscscan(api_key)
+        try:
+            abi_response = json.loads(urlopen(
+                Request(url, headers={'User-Agent': 'Mozilla'}), timeout=timeout).read().decode('utf8'))
+        except OSError as e:
+            if attempt == retries - 1:
+                raise
+            print(f"Fetching ABI for {contract} failed, retrying.", e)
+            time.sleep(2 ** attempt)
+            continue
+
+        if abi_response.get('status') != '0':
+            return abi_response['result']
+        if 'rate limit' not in str(abi_response.get('result')).lower() or attempt == retries - 1:
+            raise Exception(
+                f"BscScan has no ABI for {contract}: {abi_response['result']}")
+        print(f"BscScan rate limited fetching the ABI for {contract}, retrying.")
+        time.sleep(BSCSCAN_RATE[bool(api_key)] * 2 ** attempt)
+
+
+def fetch_abi(contract, api_key=None):
+    if contract in abi_cache:
+        return abi_cache[contract]
+
+    if not abi_bundle_loaded:
+        load_abi_bundle()
+        if contract in abi_cache:
+            return abi_cache[contract]
+
+    os.makedirs('contracts', exist_ok=True)
 
     filename = f'contracts/{contract}.json'
     if os.path.exists(filename):
         with open(filename, 'r') as abi_file:
             abi = abi_file.read()
     else:
-        # TODO: Error handling
-        url = 'https://api.bscscan.com/api?module=contract&action=getabi&address=' + contract
-        abi_response = urlopen(
-            Request(url, headers={'User-Agent': 'Mozilla'})).read().decode('utf8')
-        abi = json.loads(abi_response)['result']
+        abi = download_abi(contract, api_key=api_key)
 
         with open(filename, 'w') as abi_file:
             abi_file.write(abi)
 
-    return json.loads(abi)
+    abi_cache[contract] = intern_abi(json.loads(abi))
+    return abi_cache[contract]
+
+
+def prefetch_abis(contracts, api_key=None):
+    # fetch missing ABIs side by side, as far as BscScan's rate limit allows
+    if not abi_bundle_loaded:
+        load_abi_bundle()
+
+    missing = set(contract for contract in contracts if contract not in abi_cache)
+    if len(missing) > 1 and api_key:
+        with ThreadPoolExecutor(max_workers=min(len(missing), 5)) as executor:
+            list(executor.map(lambda contract: fetch_abi(contract, api_key), missing))
+
+    return [fetch_abi(contract, api_key) for contract in contracts]
 
 
 def list_cogs(directory, file=__file__):
@@ -31,4 +124,9 @@ def list_cogs(directory, file=__file__):
 
 
 def shift(decimal, n):
-    return decimal * (Decimal('10') ** n)
+    return decimal * scale(n)
+
+
+if __name__ == '__main__':
+    write_abi_bundle()
+    print(f"Wrote {len(abi_cache)} ABIs to {ABI_BUNDLE}")
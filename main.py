@@ -1,7 +1,10 @@
+import asyncio
+import copy
 import sys
 import importlib
 from pricebot import pricebot
 from boardroombot import boardroombot
+from bot.pricebus import run_fetcher
 import yaml
 
 bots = {}
@@ -12,10 +15,18 @@ with open('config.yaml') as cfg_file:
 cfg_defaults = cfg_data.pop('_config')
 
 if len(sys.argv) < 2:
-    print(f"Usage: {sys.argv[0]} <name>")
+    print(f"Usage: {sys.argv[0]} <name>|--all|--fetcher")
     sys.exit()
 
-if sys.argv[1] and cfg_data.get(sys.argv[1]):
+run_fetcher_only = sys.argv[1] == '--fetcher'
+run_all = sys.argv[1] == '--all' or run_fetcher_only
+
+if run_fetcher_only and not cfg_defaults.get('price_bus'):
+    raise Exception("The fetcher needs a price_bus file in _config")
+
+if run_all:
+    pass
+elif sys.argv[1] and cfg_data.get(sys.argv[1]):
     cfg_data = {sys.argv[1]: cfg_data.get(sys.argv[1])}
 else:
     raise Exception(f"{sys.argv[1]} does not exist in configuration!")
@@ -33,7 +44,14 @@ for cfg_name, cfg_info in cfg_data.items():
 
     common['name'] = cfg_name
 
-    config = ({**cfg_defaults, **cfg_info.get('config', {})})
+    # instances mutate their config (e.g. channel restrictions), so don't share it
+    config = copy.deepcopy({**cfg_defaults, **cfg_info.get('config', {})})
+
+    if run_fetcher_only:
+        # the fetcher publishes prices for every token that reads LP reserves
+        if not token or config.get('plugin') or config['amm'].get(common['amm'], {}).get('stableswap'):
+            continue
+        config['price_bus_writer'] = True
 
     if config.get('plugin'):
         try:
@@ -53,4 +71,24 @@ for cfg_name, cfg_info in cfg_data.items():
                 config, common, boardroom)
         bots[cfg_name] = instance
 
-    bots[cfg_name].exec()
+    if not run_all:
+        bots[cfg_name].exec()
+
+if run_fetcher_only:
+    print(f"Publishing prices for {', '.join(bots)} to {cfg_defaults['price_bus']}")
+    try:
+        asyncio.get_event_loop().run_until_complete(
+            run_fetcher(list(bots.values()), cfg_defaults.get('fetch_interval', 3)))
+    except KeyboardInterrupt:
+        pass
+elif run_all:
+    # every client shares the default event loop, web3 provider and caches
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(asyncio.gather(
+            *(instance.launch() for instance in bots.values())))
+    except KeyboardInterrupt:
+        loop.run_until_complete(asyncio.gather(
+            *(instance.close() for instance in bots.values())))
+    finally:
+        loop.close()
@@ -0,0 +1,114 @@
+import bisect
+from functools import partial
+
+from pricebot.commands.models.prices import PriceAlert
+
+
+class PriceAlerts:
+    """Price levels users asked to be pinged at, for one token.
+
+    Levels waiting for the price to rise and to fall are kept in two lists
+    sorted by price, so each tick finds every crossed level with one bisect
+    per list, however many alerts there are. An alert fires once and is
+    then deleted."""
+
+    def __init__(self, database, token, max_per_user=10):
+        self.database = database
+        self.token = token
+        self.max_per_user = max_per_user
+        self.prices = {True: [], False: []}  # above -> sorted levels
+        self.ids = {True: [], False: []}  # above -> alert ids, in the same order
+        self.alerts = {}  # id -> (user_id, channel_id, price, above)
+        self.by_user = {}  # user_id -> ids
+
+    async def restore(self):
+        for alert in await self.database.run(self.load):
+            self.index(*alert)
+
+    def load(self, session):
+        return [(alert.id, alert.user_id, alert.channel_id, alert.price, alert.above)
+                for alert in session.query(PriceAlert).filter(PriceAlert.token == self.token)]
+
+    def index(self, alert_id, user_id, channel_id, price, above):
+        i = bisect.bisect_right(self.prices[above], price)
+        self.prices[above].insert(i, price)
+        self.ids[above].insert(i, alert_id)
+        self.alerts[alert_id] = (user_id, channel_id, price, above)
+        self.by_user.setdefault(user_id, set()).add(alert_id)
+
+    def unindex(self, alert_id):
+        (user_id, _, price, above) = alert = self.alerts.pop(alert_id)
+        (prices, ids) = (self.prices[above], self.ids[above])
+        i = bisect.bisect_left(prices, price)
+        while ids[i] != alert_id:
+            i += 1
+        del prices[i], ids[i]
+        self.forget_user(user_id, alert_id)
+        return alert
+
+    def forget_user(self, user_id, alert_id):
+        self.by_user[user_id].discard(alert_id)
+        if not self.by_user[user_id]:
+            del self.by_user[user_id]
+
+    def insert(self, user_id, channel_id, price, above, session):
+        alert = PriceAlert(token=self.token, user_id=user_id, channel_id=channel_id, price=price, above=above)
+        session.add(alert)
+        session.flush()
+        return alert.id
+
+    def delete(self, alert_ids, session):
+        session.query(PriceAlert).filter(PriceAlert.id.in_(alert_ids)).delete(synchronize_session=False)
+
+    async def add(self, user_id, channel_id, price, current_price):
+        """Saves an alert for when the price gets from where it is now to
+        `price`. Returns False if the user has too many alerts already."""
+        if len(self.by_user.get(user_id, ())) >= self.max_per_user:
+            return False
+
+        (price, above) = (float(price), price > current_price)
+        alert_id = await self.database.run(partial(self.insert, user_id, channel_id, price, above))
+        self.index(alert_id, user_id, channel_id, price, above)
+        return True
+
+    async def remove(self, user_id, alert_id):
+        if alert_id not in self.by_user.get(user_id, ()):
+            return False
+
+        await self.database.run(partial(self.delete, [alert_id]))
+        if alert_id in self.alerts:
+            self.unindex(alert_id)
+        return True
+
+    def list(self, user_id):
+        return sorted(((alert_id, *self.alerts[alert_id]) for alert_id in self.by_user.get(user_id, ())),
+                      key=lambda alert: alert[3])
+
+    async def check(self, price):
+        """Removes and returns every alert the price has reached, once they
+        are deleted from the database, so none fires twice."""
+        price = float(price)
+
+        # rising alerts at or below the price, falling ones at or above it
+        rising = bisect.bisect_right(self.prices[True], price)
+        falling = bisect.bisect_left(self.prices[False], price)
+        fired = self.ids[True][:rising] + self.ids[False][falling:]
+        if not fired:
+            return []
+
+        del self.prices[True][:rising], self.ids[True][:rising]
+        del self.prices[False][falling:], self.ids[False][falling:]
+
+        alerts = {}
+        for alert_id in fired:
+            alerts[alert_id] = self.alerts.pop(alert_id)
+            self.forget_user(alerts[alert_id][0], alert_id)
+
+        try:
+            await self.database.run(partial(self.delete, fired))
+        except Exception as e:
+            print(f"Deleting fired alerts for {self.token} failed, keeping them:", repr(e))
+            for alert_id, alert in alerts.items():
+                self.index(alert_id, *alert)
+            return []
+        return list(alerts.values())
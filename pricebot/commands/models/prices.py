@@ -14,3 +14,64 @@ class PriceATH(Base):
 
     def __repr__(self):
         return f"<ATH of {self.price} for {str(self.token)} at {self.timestamp}>"
+
+
+class PriceTick(Base):
+    __tablename__ = 'price_tick'
+    __table_args__ = (Index('ix_price_tick_token_timestamp', 'token', 'timestamp'),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    token = Column(String, nullable=False)
+    block_number = Column(Integer)
+    timestamp = Column(DateTime, nullable=False)
+    price = Column(Float, nullable=False)
+    quote_amount = Column(Float)
+    token_amount = Column(Float)
+
+    def __repr__(self):
+        return f"<Price of {self.price} for {str(self.token)} at block {self.block_number}>"
+
+
+class PriceCandle(Base):
+    __tablename__ = 'price_candle'
+
+    token = Column(String, primary_key=True)
+    resolution = Column(Integer, primary_key=True)  # seconds
+    start = Column(DateTime, primary_key=True)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
+
+    def __repr__(self):
+        return f"<{self.resolution}s candle for {str(self.token)} at {self.start}: {self.open}/{self.high}/{self.low}/{self.close}>"
+
+
+class Watchlist(Base):
+    __tablename__ = 'watchlist'
+    __table_args__ = (UniqueConstraint('user_id', 'token', 'address'),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, nullable=False, index=True)
+    token = Column(String, nullable=False)
+    address = Column(String, nullable=False)
+    label = Column(String)
+
+    def __repr__(self):
+        return f"<Watched {self.address} ({self.label}) by {self.user_id} for {str(self.token)}>"
+
+
+class PriceAlert(Base):
+    __tablename__ = 'price_alert'
+    __table_args__ = (Index('ix_price_alert_token_user_id', 'token', 'user_id'),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    token = Column(String, nullable=False)
+    user_id = Column(BigInteger, nullable=False)
+    channel_id = Column(BigInteger)  # None to send it as a DM
+    price = Column(Float, nullable=False)
+    above = Column(Boolean, nullable=False)  # fires when the price rises to it, or falls to it
+    timestamp = Column(DateTime, nullable=False, default=func.now())
+
+    def __repr__(self):
+        return f"<Alert {'above' if self.above else 'below'} {self.price} for {str(self.token)} by {self.user_id}>"
@@ -1,66 +1,104 @@
+import asyncio
 import math
 from datetime import datetime
+from functools import partial
 
 import discord
 from discord.ext import tasks, commands
 from decimal import Decimal, DecimalException
 from web3 import Web3
+from sqlalchemy.dialects.sqlite import insert
+from bot.fixedpoint import to_decimal
+from bot.utils import shift
+from bot.metrics import metrics
+from pricebot.alerts import PriceAlerts
 from pricebot.commands.models import prices
+from pricebot.history import RESOLUTIONS
 
 
 class Prices(commands.Cog, command_attrs=dict(hidden=True)):
     current_ath = None
+    restored = False
+    schedule = None
+    max_wallets = 50
+    wallets_per_page = 10
 
     def __init__(self, bot):
         self.bot = bot
-        self.db = bot.db
-
-        prices.Base.metadata.create_all(self.bot.dbengine)
-        query = self.db.query(prices.PriceATH).filter(
-            prices.PriceATH.token == self.bot.token['contract'])
-        if result := query.first():
-            self.current_ath = result
+        self.database = bot.database
+        self.price_history = bot.price_history
+        self.alerts = PriceAlerts(self.database, self.bot.token['contract'], bot.config.get('max_alerts', 10))
+
+    def load_ath(self, session):
+        if ath := session.query(prices.PriceATH).filter(
+                prices.PriceATH.token == self.bot.token['contract']).first():
+            session.expunge(ath)
+        return ath
+
+    def save_ath(self):
+        values = {
+            'token': self.current_ath.token,
+            'price': float(self.current_ath.price),
+            'timestamp': self.current_ath.timestamp
+        }
+        statement = insert(prices.PriceATH.__table__).on_conflict_do_update(
+            index_elements=['token'], set_={'price': values['price'], 'timestamp': values['timestamp']})
+        self.database.submit(
+            lambda session: session.execute(statement, values))
+
+    async def restore(self):
+        # not in __init__: with --all, cogs load inside the running event loop
+        self.current_ath = await self.database.run(self.load_ath)
+        await self.alerts.restore()
+        await self.price_history.restore()
+        self.restored = True
 
     @commands.Cog.listener()
     async def on_ready(self):
+        if not self.restored:
+            await self.restore()
         await self.update_price()
 
-        self.bot.priceloop = tasks.loop(
-            seconds=self.bot.config['refresh_rate'])(self.update_price)
+        # wake up often, but only refresh as often as the price is moving
+        refresh_rate = self.bot.config['refresh_rate']
+        self.schedule = self.bot.schedule('priceloop', refresh_rate)
+        self.bot.priceloop = tasks.loop(seconds=self.schedule.min_interval)(self.bot.follow_blocks(
+            metrics.loop('priceloop', lambda: self.schedule.interval, self.update_price,
+                         bot=self.bot.common['name']), refresh_rate, self.schedule))
         self.bot.priceloop.add_exception_type(discord.errors.HTTPException)
         self.bot.priceloop.start()
 
     async def update_price(self):
         try:
-            self.bot.current_price = self.bot.get_token_price()
-        except Exception:
+            self.bot.current_price = await self.bot.run_rpc(self.bot.get_token_price)
+        except Exception as e:
             # Ignore issues with blockchain timeouts, but don't update anything
+            print(f"Skipping {self.bot.common['name']} price update:", repr(e))
+            metrics.inc('bot_skipped_ticks_total', bot=self.bot.common['name'], loop='priceloop')
             return
 
-        for guild in self.bot.guilds:
-            await guild.me.edit(nick=self.bot.generate_nickname())
+        if self.schedule:
+            self.schedule.record(self.bot.current_price, self.bot.block_number)
+        self.bot.publisher.publish_nickname(self.bot.generate_nickname())
+        self.price_history.record(self.bot.current_price, self.bot.quote_amount,
+                                  self.bot.token_amount, self.bot.block_number)
+
+        fired = await self.alerts.check(self.bot.current_price)
+        if fired:
+            asyncio.ensure_future(self.notify(fired, self.bot.current_price))
 
         if self.current_ath:
             if self.bot.current_price > self.current_ath.price:
-                try:
-                    self.current_ath.price = self.bot.current_price
-                    self.current_ath.timestamp = datetime.utcnow()
-
-                    self.db.update(self.current_ath)
-                    self.db.commit()
-                    return await self.bot.change_presence(activity=discord.Game(name='ATH Hit!'))
-                except Exception:
-                    pass
+                self.current_ath.price = self.bot.current_price
+                self.current_ath.timestamp = datetime.utcnow()
+                self.save_ath()
+                return self.bot.publisher.publish_presence('ATH Hit!')
         else:
-            ath = prices.PriceATH(
-                token=self.bot.token['contract'], price=self.bot.current_price)
-            self.db.add(ath)
-            self.db.commit()
-
-            self.current_ath = ath
+            self.current_ath = prices.PriceATH(
+                token=self.bot.token['contract'], price=self.bot.current_price, timestamp=datetime.utcnow())
+            self.save_ath()
 
-        presence = self.bot.generate_presence()
-        await self.bot.change_presence(activity=discord.Game(name=presence))
+        self.bot.publisher.publish_presence(self.bot.generate_presence())
 
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
@@ -79,7 +117,7 @@ class Prices(commands.Cog, command_attrs=dict(hidden=True)):
         num_tokens = abs(self.bot.parse_decimal(num_tokens) or 1)
 
         with ctx.typing():
-            self.bot.get_token_price()
+            await self.bot.run_rpc(self.bot.get_token_price)
             values = await self.bot.get_lp_value()
             lp_price = self.bot.current_price * values[0] * 2
 
@@ -106,6 +144,8 @@ class Prices(commands.Cog, command_attrs=dict(hidden=True)):
     @commands.command(help='Display BNB value of tokens')
     async def convert(self, ctx: commands.Context, num_tokens=None):
         num_tokens = self.bot.parse_decimal(num_tokens) or Decimal(1)
+        if not num_tokens.is_finite():
+            return await ctx.channel.send('Please send a valid amount!')
 
         try:
             token_in_bnb = self.bot.quote_amount / self.bot.token_amount
@@ -120,8 +160,15 @@ class Prices(commands.Cog, command_attrs=dict(hidden=True)):
 
         usd = Decimal(token_in_bnb * self.bot.bnb_price *
                       num_tokens).quantize(self.bot.display_precision)
+        output_body = f"{output_body} _(${usd})_"
+
+        # what selling them would actually fill at, from the same reserves
+        if num_tokens > 0 and (quotes := self.bot.quote_ladder([int(shift(num_tokens, self.bot.token['decimals']))])):
+            (_, received, impact) = quotes[0]
+            output_body += f"\nSelling: {bnb_emoji} {to_decimal(received, 18):.6g} _({impact:.2%} price impact)_"
+
         embed = discord.Embed(color=0x3D85C6, title=token_emoji + ' ' + output_header,
-                              description=f"{output_body} _(${usd})_")
+                              description=output_body)
 
         amm_info = self.bot.get_amm()
         if amm_info.get('name'):
@@ -129,6 +176,54 @@ class Prices(commands.Cog, command_attrs=dict(hidden=True)):
 
         await ctx.channel.send(embed=embed)
 
+    @staticmethod
+    def format_amount(amount):
+        return f"{amount:,.0f}" if amount >= 1000 else f"{float(amount):.6g}"
+
+    @commands.command(help='Price impact of trades, e.g. sell 1000 10000 or buy 1 10')
+    async def quote(self, ctx: commands.Context, side='sell', *amounts):
+        if side.lower() not in ('buy', 'sell'):
+            (side, amounts) = ('sell', (side,) + amounts)
+        sell = side.lower() == 'sell'
+
+        token_decimals = self.bot.token['decimals']
+        (decimals_in, decimals_out) = (token_decimals, 18) if sell else (18, token_decimals)
+        bnb_emoji = self.bot.config['bnb_emoji']
+
+        sizes = [self.bot.parse_decimal(amount) for amount in amounts[:10]]
+        if any(size is None or not size.is_finite() or size <= 0 for size in sizes):
+            return await ctx.channel.send('Please use positive amounts, e.g. `quote sell 1000 10000`!')
+        if not sizes:
+            # a ladder of dollar values
+            unit_price = self.bot.price_busd if sell else (self.bot.bnb_price or 1)
+            if not unit_price:
+                return await ctx.channel.send('No price yet!')
+            sizes = [Decimal(usd) / unit_price for usd in (100, 1000, 10000, 100000)]
+
+        quotes = self.bot.quote_ladder([int(shift(size, decimals_in)) for size in sizes], sell)
+        if not quotes:
+            return await ctx.channel.send('Quotes need a UniswapV2-style pair!')
+
+        (pay_unit, receive_unit) = (self.bot.token['icon'], bnb_emoji) if sell else (bnb_emoji, self.bot.token['icon'])
+        lines = [['Pay', 'Receive', 'Impact']]
+        for amount_in, received, impact in quotes:
+            lines.append([self.format_amount(to_decimal(amount_in, decimals_in)),
+                          self.format_amount(to_decimal(received, decimals_out)), f"{impact:.2%}"])
+
+        col_widths = [max(len(line[i]) for line in lines)
+                      for i in range(len(lines[0]))]
+        table = '\n'.join(' '.join(value.rjust(col_widths[i]) for i, value in enumerate(line))
+                          for line in lines)
+
+        embed = discord.Embed(color=0x3D85C6, title=f"{self.bot.icon_value()} {'Selling' if sell else 'Buying'}",
+                              description=f"{pay_unit} → {receive_unit}```{table}```")
+        footer_text = f"{self.bot.amm.get('fee', 25) / 100:g}% fee | block {self.bot.block_number}"
+        if self.bot.amm.get('name'):
+            footer_text += f" | via {self.bot.amm.get('name')}"
+        embed.set_footer(text=footer_text)
+
+        await ctx.channel.send(embed=embed)
+
     @commands.command()
     async def ath(self, ctx: commands.Context):
         token_emoji = self.bot.icon_value()
@@ -149,6 +244,53 @@ class Prices(commands.Cog, command_attrs=dict(hidden=True)):
 
         await ctx.channel.send(embed=embed)
 
+    @commands.command(help='Price change over a period, e.g. 24h or 7d')
+    async def change(self, ctx: commands.Context, period='24h'):
+        seconds = self.bot.parse_period(period)
+        if not seconds:
+            return await ctx.channel.send('Please use a period like 1h, 24h or 7d!')
+
+        if not (result := self.price_history.change(seconds)):
+            return await ctx.channel.send('No price history yet!')
+
+        (start, old_price, price) = result
+        change = (price - old_price) / old_price if old_price else 0
+
+        output_body = f"**{change:+.2%}** (${old_price:.6g} → ${price:.6g})"
+        embed = discord.Embed(color=discord.Color.green() if change >= 0 else discord.Color.red(),
+                              title=f"{self.bot.icon_value()} {period} Change", description=output_body)
+        embed.set_footer(text=f"Since {start.strftime('%Y-%m-%d %H:%M UTC')}")
+
+        await ctx.channel.send(embed=embed)
+
+    @commands.command(help='Recent price candles, e.g. 1h 12')
+    async def history(self, ctx: commands.Context, resolution='1h', count=12):
+        if resolution not in RESOLUTIONS:
+            return await ctx.channel.send(f"Please use one of {', '.join(RESOLUTIONS)}!")
+
+        count = self.bot.parse_int(count)
+        if count is None:
+            return await ctx.channel.send('Please use a number of candles like 12!')
+
+        candles = self.price_history.history(resolution, max(1, min(count, 24)))
+        if not candles:
+            return await ctx.channel.send('No price history yet!')
+
+        time_format = '%m-%d' if resolution == '1d' else '%m-%d %H:%M'
+        lines = [['Time', 'Open', 'High', 'Low', 'Close']]
+        for candle in candles:
+            lines.append([candle[0].strftime(time_format)] +
+                         [format(value, '.6g') for value in candle[1:]])
+
+        col_widths = [max(len(line[i]) for line in lines)
+                      for i in range(len(lines[0]))]
+        table = '\n'.join(' '.join(value.rjust(col_widths[i]) for i, value in enumerate(line))
+                          for line in lines)
+
+        embed = discord.Embed(color=0x3D85C6, title=f"{self.bot.icon_value()} {resolution} Candles",
+                              description=f"```{table}```")
+        await ctx.channel.send(embed=embed)
+
     @commands.command(help='Death to fractions!')
     @commands.dm_only()
     async def round(self, ctx: commands.Context, address):
@@ -160,8 +302,8 @@ class Prices(commands.Cog, command_attrs=dict(hidden=True)):
         async with ctx.typing():
             i = 0
             exponent = 10 ** self.bot.token['decimals']
-            token_balance = Decimal(
-                self.bot.contracts['token'].functions.balanceOf(address).call()) / exponent
+            token_balance = Decimal(await self.bot.run_rpc(
+                self.bot.contracts['token'].functions.balanceOf(address).call)) / exponent
             lines = [['To Get', 'Purchase']]
 
             if token_balance:
@@ -192,24 +334,195 @@ class Prices(commands.Cog, command_attrs=dict(hidden=True)):
 
         await ctx.channel.send(embed=embed)
 
-    @commands.command(help="What's in my pocket?")
-    async def balance(self, ctx: commands.Context, address):
-        try:
-            address = Web3.toChecksumAddress(address)
-        except ValueError:
-            return await ctx.channel.send('Please send a valid wallet address!')
+    def parse_addresses(self, addresses):
+        valid, invalid = [], []
+        for address in addresses:
+            try:
+                address = Web3.toChecksumAddress(address)
+            except ValueError:
+                invalid.append(address)
+                continue
+            if address not in valid:
+                valid.append(address)
+        return (valid, invalid)
+
+    def read_balances(self, addresses):
+        token = self.bot.contracts['token']
+        return self.bot.read({address: token.functions.balanceOf(address) for address in addresses})
+
+    def load_watchlist(self, user_id, session):
+        return [(watched.address, watched.label) for watched in session.query(prices.Watchlist).filter(
+            prices.Watchlist.user_id == user_id,
+            prices.Watchlist.token == self.bot.token['contract']).order_by(prices.Watchlist.id)]
+
+    def add_watched(self, user_id, address, label, session):
+        watched = session.query(prices.Watchlist).filter(
+            prices.Watchlist.user_id == user_id, prices.Watchlist.token == self.bot.token['contract'])
+        if existing := watched.filter(prices.Watchlist.address == address).first():
+            existing.label = label
+            return True
+        if watched.count() >= self.max_wallets:
+            return False
+
+        session.add(prices.Watchlist(user_id=user_id, token=self.bot.token['contract'],
+                                     address=address, label=label))
+        return True
+
+    def remove_watched(self, user_id, address, session):
+        return session.query(prices.Watchlist).filter(
+            prices.Watchlist.user_id == user_id, prices.Watchlist.token == self.bot.token['contract'],
+            prices.Watchlist.address == address).delete()
+
+    def balance_pages(self, balances, labels):
+        decimals = self.bot.token['decimals']
+        amounts = {address: to_decimal(raw, decimals) for address, raw in balances.items()}
+        total = sum(amounts.values())
+        price = self.bot.price_busd
+
+        lines = [f"`{address[:6]}…{address[-4:]}` {labels.get(address) or ''}\n"
+                 f"{self.bot.icon_value(f'{amount:,.4f}')} _(≈ ${amount * price:,.2f})_"
+                 for address, amount in amounts.items()]
+        chunks = [lines[i:i + self.wallets_per_page] for i in range(0, len(lines), self.wallets_per_page)]
+
+        pages = []
+        for i, chunk in enumerate(chunks):
+            embed = discord.Embed(color=discord.Color.green(), title=f"{self.bot.icon_value()} Balances",
+                                  description='\n'.join(chunk))
+            footer = f"{len(amounts)} wallets: {total:,.4f} ≈ ${total * price:,.2f}"
+            if len(chunks) > 1:
+                footer += f" | Page {i + 1}/{len(chunks)}"
+            embed.set_footer(text=footer)
+            pages.append(embed)
+        return pages
+
+    @commands.command(help="What's in my pockets? Takes any number of addresses, or checks your watchlist")
+    async def balance(self, ctx: commands.Context, *addresses):
+        (addresses, invalid) = self.parse_addresses(addresses)
+        if invalid:
+            return await ctx.channel.send(f"Please send valid wallet addresses! ({', '.join(invalid[:3])})")
+
+        labels = {}
+        if not addresses:
+            labels = dict(await self.database.run(partial(self.load_watchlist, ctx.author.id)))
+            if not labels:
+                return await ctx.channel.send('Please send a wallet address, or save some with `watch add`!')
+            addresses = list(labels)
 
         async with ctx.typing():
-            exponent = 10 ** self.bot.token['decimals']
-            token_balance = Decimal(
-                self.bot.contracts['token'].functions.balanceOf(address).call()) / exponent
+            # every wallet in one multicall
+            balances = await self.bot.run_rpc(self.read_balances, tuple(addresses[:self.max_wallets]))
+
+        if not any(balances.values()):
+            embed = discord.Embed(color=0xff2400, title="No Balance",
+                                  description=f"{'This wallet has' if len(balances) == 1 else 'These wallets have'} 0 {self.bot.token['icon']}")
+            return await ctx.message.reply(embed=embed)
 
-        if token_balance:
-            return await self.convert(ctx, token_balance)
+        await self.bot.paginate(ctx, self.balance_pages(balances, labels))
 
-        embed = discord.Embed(color=0xff2400, title="No Balance",
-                              description=f"This wallet has 0 {self.bot.token['icon']}")
-        await ctx.message.reply(embed=embed)
+    @commands.group(help='Save wallets for the balance command')
+    async def watch(self, ctx: commands.Context):
+        if ctx.invoked_subcommand is None:
+            await self.watch_list(ctx)
+
+    @watch.command(name='add', help='Save a wallet, with an optional label')
+    async def watch_add(self, ctx: commands.Context, address, *, label=None):
+        (addresses, _) = self.parse_addresses([address])
+        if not addresses:
+            return await ctx.channel.send('Please send a valid wallet address!')
+
+        if not await self.database.run(partial(self.add_watched, ctx.author.id, addresses[0], label)):
+            return await ctx.channel.send(f"You can save up to {self.max_wallets} wallets!")
+        await ctx.message.add_reaction('👍')
+
+    @watch.command(name='remove', help='Forget a saved wallet')
+    async def watch_remove(self, ctx: commands.Context, address):
+        (addresses, _) = self.parse_addresses([address])
+        if not addresses or not await self.database.run(
+                partial(self.remove_watched, ctx.author.id, addresses[0])):
+            return await ctx.channel.send("That wallet isn't on your watchlist!")
+        await ctx.message.add_reaction('👍')
+
+    @watch.command(name='list', help='Show your saved wallets')
+    async def watch_list(self, ctx: commands.Context):
+        watched = await self.database.run(partial(self.load_watchlist, ctx.author.id))
+        if not watched:
+            return await ctx.channel.send('Your watchlist is empty!')
+
+        lines = [f"`{address}` {label or ''}" for address, label in watched]
+        await ctx.channel.send(embed=discord.Embed(
+            color=0x3D85C6, title=f"{self.bot.icon_value()} Watchlist", description='\n'.join(lines)))
+
+    async def notify(self, fired, price):
+        """Sends one message per channel (or DM) for every alert that fired on
+        this tick, so a crowded level doesn't hit Discord's rate limits."""
+        batches = {}
+        for (user_id, channel_id, level, above) in fired:
+            target = ('channel', channel_id) if channel_id else ('user', user_id)
+            batches.setdefault(target, []).append(
+                f"<@{user_id}> {'above' if above else 'below'} ${self.format_amount(level)}")
+
+        header = f"{self.bot.icon_value()} is now ${self.format_amount(price)}"
+
+        async def send(target, lines):
+            (kind, target_id) = target
+            if kind == 'channel':
+                destination = self.bot.get_channel(target_id)
+            else:
+                destination = self.bot.get_user(target_id) or await self.bot.fetch_user(target_id)
+            if destination is None:
+                return
+
+            message = header
+            for line in lines:
+                if len(message) + len(line) >= 2000:
+                    await destination.send(message)
+                    message = header
+                message += '\n' + line
+            await destination.send(message)
+
+        results = await asyncio.gather(*(send(target, lines) for target, lines in batches.items()),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Sending {self.bot.common['name']} price alerts failed:", repr(result))
+
+    @commands.group(help='Get pinged when the price reaches a level')
+    async def alert(self, ctx: commands.Context):
+        if ctx.invoked_subcommand is None:
+            await self.alert_list(ctx)
+
+    @alert.command(name='add', help='Ping me when the price reaches a level, e.g. alert add 1.25')
+    async def alert_add(self, ctx: commands.Context, price):
+        price = self.bot.parse_decimal(price.lstrip('$'))
+        if not price or not price.is_finite() or price <= 0:
+            return await ctx.channel.send('Please send a valid price!')
+        if not self.bot.price_busd:
+            return await ctx.channel.send("The price hasn't been read yet, please try again shortly!")
+        if price == self.bot.price_busd:
+            return await ctx.channel.send("The price is already there!")
+
+        channel_id = None if isinstance(ctx.channel, discord.channel.DMChannel) else ctx.channel.id
+        if not await self.alerts.add(ctx.author.id, channel_id, price, self.bot.price_busd):
+            return await ctx.channel.send(f"You can set up to {self.alerts.max_per_user} alerts!")
+        await ctx.message.add_reaction('👍')
+
+    @alert.command(name='remove', help='Cancel an alert by its number in alert list')
+    async def alert_remove(self, ctx: commands.Context, alert_id):
+        alert_id = self.bot.parse_int(alert_id.lstrip('#'))
+        if alert_id is None or not await self.alerts.remove(ctx.author.id, alert_id):
+            return await ctx.channel.send("That isn't one of your alerts!")
+        await ctx.message.add_reaction('👍')
+
+    @alert.command(name='list', help='Show your price alerts')
+    async def alert_list(self, ctx: commands.Context):
+        alerts = self.alerts.list(ctx.author.id)
+        if not alerts:
+            return await ctx.channel.send('You have no price alerts!')
+
+        lines = [f"`#{alert_id}` {'above' if above else 'below'} ${self.format_amount(price)}"
+                 for (alert_id, _, _, price, above) in alerts]
+        await ctx.channel.send(embed=discord.Embed(
+            color=0x3D85C6, title=f"{self.bot.icon_value()} Price Alerts", description='\n'.join(lines)))
 
 
 def setup(bot: commands.Bot):
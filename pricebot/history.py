@@ -0,0 +1,162 @@
+import bisect
+from datetime import datetime, timedelta
+from functools import partial
+
+from sqlalchemy.dialects.sqlite import insert
+
+from pricebot.commands.models.prices import PriceCandle, PriceTick
+
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+# seconds to keep raw ticks and each candle size; daily candles are kept forever
+RETENTION = {'tick': 86400, '1m': 2 * 86400, '1h': 90 * 86400}
+
+# candles held in memory per resolution for change/history lookups
+MEMORY = {'1m': 24 * 60, '1h': 8 * 24, '1d': 400}
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def bucket(timestamp, seconds):
+    elapsed = int((timestamp - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=elapsed - elapsed % seconds)
+
+
+class PriceHistory:
+    """Appends every price tick and rolls them up into 1m/1h/1d OHLC candles.
+
+    Ticks and touched candles are buffered and handed to the database writer
+    in batches. Recent candles stay in memory, so change and history lookups
+    never scan raw ticks."""
+
+    def __init__(self, database, token, batch_size=20, retention={}):
+        self.database = database
+        self.token = token
+        self.batch_size = batch_size
+        self.retention = {**RETENTION, **retention}
+        self.pruned = None
+
+        self.ticks = []
+        self.dirty = {}  # (resolution, start) -> candle
+        self.starts = {name: [] for name in RESOLUTIONS}
+        self.candles = {name: [] for name in RESOLUTIONS}  # [start, open, high, low, close]
+
+    async def restore(self):
+        for name, candles in (await self.database.run(self.load)).items():
+            for candle in candles:
+                self.starts[name].append(candle[0])
+                self.candles[name].append(candle)
+
+    def load(self, session):
+        candles = {}
+        for name, seconds in RESOLUTIONS.items():
+            rows = session.query(PriceCandle).filter(
+                PriceCandle.token == self.token, PriceCandle.resolution == seconds
+            ).order_by(PriceCandle.start.desc()).limit(MEMORY[name]).all()
+
+            candles[name] = [[row.start, row.open, row.high, row.low, row.close]
+                             for row in reversed(rows)]
+        return candles
+
+    def record(self, price, quote_amount=None, token_amount=None, block_number=None, timestamp=None):
+        timestamp = timestamp or datetime.utcnow()
+        price = float(price)
+
+        self.ticks.append({
+            'token': self.token,
+            'block_number': block_number,
+            'timestamp': timestamp,
+            'price': price,
+            'quote_amount': float(quote_amount) if quote_amount is not None else None,
+            'token_amount': float(token_amount) if token_amount is not None else None
+        })
+
+        for name, seconds in RESOLUTIONS.items():
+            start = bucket(timestamp, seconds)
+            starts, candles = self.starts[name], self.candles[name]
+
+            if starts and starts[-1] == start:
+                candle = candles[-1]
+                candle[2] = max(candle[2], price)
+                candle[3] = min(candle[3], price)
+                candle[4] = price
+            elif not starts or starts[-1] < start:
+                candle = [start, price, price, price, price]
+                starts.append(start)
+                candles.append(candle)
+                if len(candles) > MEMORY[name]:
+                    del starts[0], candles[0]
+            else:
+                continue
+
+            self.dirty[(name, start)] = candle
+
+        if len(self.ticks) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        ticks, self.ticks = self.ticks, []
+        dirty, self.dirty = self.dirty, {}
+
+        # the candles keep changing in memory, so write copies of them
+        rows = [{
+            'token': self.token,
+            'resolution': RESOLUTIONS[name],
+            'start': start,
+            'open': candle[1],
+            'high': candle[2],
+            'low': candle[3],
+            'close': candle[4]
+        } for (name, start), candle in dirty.items()]
+
+        if ticks or rows:
+            self.database.submit(partial(self.write, ticks, rows))
+
+    def write(self, ticks, candles, session):
+        if ticks:
+            session.bulk_insert_mappings(PriceTick, ticks)
+
+        if candles:
+            statement = insert(PriceCandle.__table__)
+            statement = statement.on_conflict_do_update(
+                index_elements=['token', 'resolution', 'start'],
+                set_={column: statement.excluded[column] for column in ('open', 'high', 'low', 'close')})
+            session.execute(statement, candles)
+
+        self.prune(session)
+
+    def prune(self, session):
+        now = datetime.utcnow()
+        if self.pruned and now - self.pruned < timedelta(hours=1):
+            return
+        self.pruned = now
+
+        session.query(PriceTick).filter(
+            PriceTick.token == self.token,
+            PriceTick.timestamp < now - timedelta(seconds=self.retention['tick'])
+        ).delete(synchronize_session=False)
+
+        for name, seconds in RESOLUTIONS.items():
+            if self.retention.get(name):
+                session.query(PriceCandle).filter(
+                    PriceCandle.token == self.token,
+                    PriceCandle.resolution == seconds,
+                    PriceCandle.start < now - timedelta(seconds=self.retention[name])
+                ).delete(synchronize_session=False)
+
+    def change(self, seconds):
+        """Returns (start, old price, current price) over the last `seconds`,
+        using the finest resolution still held in memory for that period."""
+        name = next((name for name, size in RESOLUTIONS.items()
+                     if size * MEMORY[name] >= seconds), '1d')
+        starts, candles = self.starts[name], self.candles[name]
+        if not candles:
+            return None
+
+        # the candle the period started in, or the oldest one we have
+        i = max(bisect.bisect_right(
+            starts, datetime.utcnow() - timedelta(seconds=seconds)) - 1, 0)
+        return (candles[i][0], candles[i][1], candles[-1][4])
+
+    def history(self, resolution, count):
+        return self.candles[resolution][-count:]
@@ -7,11 +7,14 @@ import discord
 from discord.ext import tasks
 from urllib.request import urlopen, Request
 from web3 import Web3
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 
+from bot import amm
+from bot.fixedpoint import ratio
 from bot.utils import fetch_abi, list_cogs, shift
 from bot.bot import Bot
+from bot.persistence import Database
+from pricebot.commands.models import prices
+from pricebot.history import PriceHistory
 
 
 class PriceBot(Bot):
@@ -19,7 +22,12 @@ class PriceBot(Bot):
     price_busd = 0
     quote_amount = 0
     token_amount = 0
+    quote_reserve = 0
+    token_reserve = 0
     total_supply = 0
+    lp_supply = 0
+    token_supply = 0
+    display_precision = Decimal(10) ** -8
 
     def __init__(self, config, common, token):
         super().__init__(config, common, token, list_cogs('commands', __file__))
@@ -29,16 +37,29 @@ class PriceBot(Bot):
         self.contracts['token'] = self.web3.eth.contract(
             address=self.token['contract'], abi=self.token_abi)
         self.contracts['lp'] = self.web3.eth.contract(
-            address=self.token['lp'], abi=fetch_abi(self.token['lp']))
+            address=self.token['lp'], abi=fetch_abi(self.token['lp'], config.get('bscscan_api_key')))
 
         if not self.token.get('decimals'):
-            self.token['decimals'] = self.contracts['token'].functions.decimals().call()
-
-        self.dbengine = create_engine('sqlite:///pricebot.db', echo=True)
-        session = sessionmaker(bind=self.dbengine)
-        self.db = session()
+            self.token['decimals'] = self.chain.read_constants({
+                'decimals': self.contracts['token'].functions.decimals()})['decimals']
+
+        # one database and writer thread, however many tokens run in this process
+        self.database = Database.shared(
+            config.get('database', 'sqlite:///pricebot.db'),
+            config.get('sql_echo', False), config.get('db_max_pending', 1000))
+        self.dbengine = self.database.engine
+        prices.Base.metadata.create_all(self.dbengine)
+
+        self.price_history = PriceHistory(
+            self.database, self.token['contract'],
+            config.get('history_batch_size', 20), config.get('history_retention', {}))
         self.get_token_price()
 
+    async def close(self):
+        await super().close()
+        self.price_history.flush()
+        self.database.release()
+
     def icon_value(self, value=None):
         if self.token['emoji'] or self.token['icon']:
             value = f" {value}" if value else ''
@@ -49,28 +70,52 @@ class PriceBot(Bot):
 
     def get_token_price(self):
         if self.amm.get('stableswap'):
-            self.price_busd = shift(Decimal(
-                self.contracts['lp'].functions.calculateSwapToBase(
-                    self.token['pool'],
-                    self.token['basePool'],
-                    self.token['fromIndex'],
-                    self.token['toIndex'],
-                    10 ** self.token['decimals']
-                ).call()), -self.token['decimals'])
+            values = self.read({**self.presence_reads(), 'price': self.contracts['lp'].functions.calculateSwapToBase(
+                self.token['pool'],
+                self.token['basePool'],
+                self.token['fromIndex'],
+                self.token['toIndex'],
+                10 ** self.token['decimals']
+            )})
+            self.price_busd = shift(
+                Decimal(values['price']), -self.token['decimals'])
+            self.token_supply = values.get('token_supply')
             return self.price_busd
 
         prices = self.get_prices(self.contracts['token'], self.token['lp'],
-                                 self.amm['address'], self.token["decimals"])
+                                 self.amm['address'], self.token["decimals"],
+                                 self.presence_reads())
         self.quote_amount = prices['quote_amount']
         self.token_amount = prices['token_amount']
+        self.quote_reserve = prices['quote_reserve']
+        self.token_reserve = prices['token_reserve']
         self.price_quote = prices['price_quote']
         self.price_busd = prices['price_busd']
+        self.lp_supply = prices.get('lp_supply')
+        self.token_supply = prices.get('token_supply')
         return prices['price_busd']
 
+    def quote_ladder(self, sizes, sell=True):
+        """Quotes raw trade sizes against the reserves from the last price
+        update, so a whole slippage table costs no RPCs."""
+        if self.amm.get('stableswap') or not self.token_reserve or not self.quote_reserve:
+            return None
+
+        if sell:
+            return amm.ladder(sizes, self.token_reserve, self.quote_reserve, self.amm.get('fee', 25))
+        return amm.ladder(sizes, self.quote_reserve, self.token_reserve, self.amm.get('fee', 25))
+
+    def presence_reads(self):
+        reads = {}
+        if not self.amm.get('stableswap'):
+            reads['lp_supply'] = self.contracts['lp'].functions.totalSupply()
+        if self.token.get('show_mc'):
+            reads['token_supply'] = self.contracts['token'].functions.totalSupply()
+        return reads
+
     def generate_presence(self):
         if self.token.get('show_mc'):
-            total_supply = shift(
-                Decimal(self.contracts['token'].functions.totalSupply().call()), -18)
+            total_supply = shift(Decimal(self.token_supply), -18)
             mc = self.price_busd * total_supply
             return f"MC=${mc:,.0f}"
 
@@ -81,10 +126,7 @@ class PriceBot(Bot):
             return ''
 
         try:
-            total_supply = shift(Decimal(self.contracts['lp'].functions.totalSupply(
-            ).call()), -18)
-            values = [Decimal(self.token_amount / total_supply),
-                      Decimal(self.quote_amount / total_supply)]
+            values = self.lp_share()
             lp_price = self.price_busd * values[0] * 2
 
             return f"LP ≈${round(lp_price, 2)} | {round(values[0], 4)} {self.token['icon']} + {round(values[1], 4)} BNB"
@@ -106,6 +148,10 @@ class PriceBot(Bot):
             return f"${price_busd:,f}"
 
     async def get_lp_value(self):
-        self.total_supply = shift(Decimal(self.contracts['lp'].functions.totalSupply(
-        ).call()), -18)
-        return [self.token_amount / self.total_supply, self.quote_amount / self.total_supply]
+        self.total_supply = shift(Decimal(self.lp_supply), -18)
+        return self.lp_share()
+
+    def lp_share(self):
+        # tokens and quote currency backing one LP token
+        return [ratio(self.token_reserve, self.token['decimals'], self.lp_supply, 18),
+                ratio(self.quote_reserve, 18, self.lp_supply, 18)]